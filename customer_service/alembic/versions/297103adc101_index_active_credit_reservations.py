@@ -0,0 +1,29 @@
+"""index active credit reservations by customer and order
+
+Revision ID: 297103adc101
+Revises: b0b7c199ee49
+Create Date: 2026-10-18 12:05:41.517302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '297103adc101'
+down_revision: Union[str, None] = 'b0b7c199ee49'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_credit_reservations_active_customer_order', 'credit_reservations',
+                    ['customer_id', 'order_id'], postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_credit_reservations_active_customer_order', table_name='credit_reservations')
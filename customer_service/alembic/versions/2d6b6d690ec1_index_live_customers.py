@@ -0,0 +1,28 @@
+"""index live customers
+
+Revision ID: 2d6b6d690ec1
+Revises: c93392929740
+Create Date: 2026-10-18 14:21:37.905513
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2d6b6d690ec1'
+down_revision: Union[str, None] = 'c93392929740'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_customers_live_id', 'customers', ['id'], postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_customers_live_id', table_name='customers')
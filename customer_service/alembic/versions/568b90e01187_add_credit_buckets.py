@@ -0,0 +1,46 @@
+"""add credit buckets
+
+Revision ID: 568b90e01187
+Revises: 297103adc101
+Create Date: 2026-10-18 12:48:09.384211
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '568b90e01187'
+down_revision: Union[str, None] = '297103adc101'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('credit_buckets',
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['customer_id'], ['customers.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_credit_buckets_customer_id'), 'credit_buckets', ['customer_id'], unique=False)
+    op.add_column('customers', sa.Column('credit_bucket_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('credit_reservations', sa.Column('credit_bucket_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('credit_reservations_credit_bucket_id_fkey', 'credit_reservations', 'credit_buckets',
+                          ['credit_bucket_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('credit_reservations_credit_bucket_id_fkey', 'credit_reservations', type_='foreignkey')
+    op.drop_column('credit_reservations', 'credit_bucket_id')
+    op.drop_column('customers', 'credit_bucket_count')
+    op.drop_index(op.f('ix_credit_buckets_customer_id'), table_name='credit_buckets')
+    op.drop_table('credit_buckets')
@@ -0,0 +1,30 @@
+"""index unprocessed outbox messages by aggregate
+
+Revision ID: a41c6e9d05b7
+Revises: 2d6b6d690ec1
+Create Date: 2026-10-18 16:02:51.337406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41c6e9d05b7'
+down_revision: Union[str, None] = '2d6b6d690ec1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_outbox_messages_unprocessed_aggregate_id', 'outbox_messages', ['aggregate_id', 'id'],
+                    unique=False, postgresql_where=sa.text('processed_on IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_outbox_messages_unprocessed_aggregate_id', table_name='outbox_messages',
+                  postgresql_where=sa.text('processed_on IS NULL'))
@@ -0,0 +1,39 @@
+"""store pre-serialized outbox payload
+
+Revision ID: b0b7c199ee49
+Revises: bd6d3795c2d8
+Create Date: 2026-10-18 11:40:27.093115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b0b7c199ee49'
+down_revision: Union[str, None] = 'bd6d3795c2d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('outbox_messages', sa.Column('payload', sa.LargeBinary(), nullable=True))
+    op.add_column('outbox_messages', sa.Column('content_type', sa.String(), nullable=True))
+    op.execute("UPDATE outbox_messages SET "
+               "payload = convert_to((data::jsonb || jsonb_build_object('aggregate_id', aggregate_id))::text, 'UTF8'), "
+               "content_type = 'application/json'")
+    op.alter_column('outbox_messages', 'payload', existing_type=sa.LargeBinary(), nullable=False)
+    op.alter_column('outbox_messages', 'content_type', existing_type=sa.String(), nullable=False)
+    op.drop_column('outbox_messages', 'data')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('outbox_messages', sa.Column('data', sa.JSON(), nullable=True))
+    op.execute("UPDATE outbox_messages SET data = (convert_from(payload, 'UTF8')::jsonb - 'aggregate_id')::json")
+    op.alter_column('outbox_messages', 'data', existing_type=sa.JSON(), nullable=False)
+    op.drop_column('outbox_messages', 'content_type')
+    op.drop_column('outbox_messages', 'payload')
@@ -0,0 +1,83 @@
+"""partition outbox_messages by created_at
+
+Revision ID: bd6d3795c2d8
+Revises: abf4b328c3f6
+Create Date: 2026-10-18 09:12:04.518230
+
+"""
+import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bd6d3795c2d8'
+down_revision: Union[str, None] = 'abf4b328c3f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, created_at, exchange, key, aggregate_id, data, processed_on, deleted_at, updated_at"
+PARTITIONS_AHEAD_MONTHS = 12
+
+
+def add_months(value: datetime.date, months: int) -> datetime.date:
+    month_index = value.year * 12 + value.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def create_outbox_table(**kwargs) -> None:
+    op.create_table('outbox_messages',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('outbox_messages_id_seq'::regclass)"), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('exchange', sa.String(), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('aggregate_id', sa.Integer(), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.Column('processed_on', sa.DateTime(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    **kwargs
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TABLE outbox_messages RENAME TO outbox_messages_unpartitioned")
+    op.execute("ALTER TABLE outbox_messages_unpartitioned RENAME CONSTRAINT outbox_messages_pkey TO outbox_messages_unpartitioned_pkey")
+
+    create_outbox_table(postgresql_partition_by='RANGE (created_at)')
+    op.create_primary_key('outbox_messages_pkey', 'outbox_messages', ['id', 'created_at'])
+
+    oldest = op.get_bind().execute(sa.text("SELECT min(created_at) FROM outbox_messages_unpartitioned")).scalar()
+    today = datetime.date.today()
+    month = datetime.date((oldest or today).year, (oldest or today).month, 1)
+    last_month = add_months(datetime.date(today.year, today.month, 1), PARTITIONS_AHEAD_MONTHS)
+    while month <= last_month:
+        op.execute(f"CREATE TABLE outbox_messages_p{month.year:04d}_{month.month:02d} PARTITION OF outbox_messages "
+                   f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+        month = add_months(month, 1)
+    op.execute("CREATE TABLE outbox_messages_default PARTITION OF outbox_messages DEFAULT")
+
+    op.execute(f"INSERT INTO outbox_messages ({COLUMNS}) SELECT {COLUMNS} FROM outbox_messages_unpartitioned")
+    op.execute("ALTER SEQUENCE outbox_messages_id_seq OWNED BY outbox_messages.id")
+    op.drop_table('outbox_messages_unpartitioned')
+
+    op.create_index('ix_outbox_messages_unprocessed', 'outbox_messages', ['id'], unique=False,
+                    postgresql_where=sa.text('processed_on IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_outbox_messages_unprocessed', table_name='outbox_messages',
+                  postgresql_where=sa.text('processed_on IS NULL'))
+    op.execute("ALTER TABLE outbox_messages RENAME TO outbox_messages_partitioned")
+    op.execute("ALTER TABLE outbox_messages_partitioned RENAME CONSTRAINT outbox_messages_pkey TO outbox_messages_partitioned_pkey")
+
+    create_outbox_table()
+    op.create_primary_key('outbox_messages_pkey', 'outbox_messages', ['id'])
+
+    op.execute(f"INSERT INTO outbox_messages ({COLUMNS}) SELECT {COLUMNS} FROM outbox_messages_partitioned")
+    op.execute("ALTER SEQUENCE outbox_messages_id_seq OWNED BY outbox_messages.id")
+    op.drop_table('outbox_messages_partitioned')
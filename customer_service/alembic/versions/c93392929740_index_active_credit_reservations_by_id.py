@@ -0,0 +1,29 @@
+"""index active credit reservations for keyset pagination
+
+Revision ID: c93392929740
+Revises: 568b90e01187
+Create Date: 2026-10-18 13:52:16.208734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c93392929740'
+down_revision: Union[str, None] = '568b90e01187'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_credit_reservations_active_customer_id', 'credit_reservations', ['customer_id', 'id'],
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_credit_reservations_active_customer_id', table_name='credit_reservations')
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from aio_pika.abc import AbstractIncomingMessage, AbstractQueue, ConsumerTag
+from pydantic import BaseModel
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.database import async_context_get_session
+
+logger = logging.getLogger(__name__)
+
+# serialization_failure, deadlock_detected, lock_not_available and query_canceled (statement_timeout)
+TRANSIENT_SQLSTATES = {"40001", "40P01", "55P03", "57014"}
+
+
+def is_transient(error: Exception) -> bool:
+    """Tells whether handling the message again can succeed, for database errors caused by concurrent work."""
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated or getattr(error.orig, "sqlstate", None) in TRANSIENT_SQLSTATES
+    return isinstance(error, OSError)
+
+
+class BatchConsumer:
+    """Consumes a queue in batches of up to ``CONSUMER_BATCH_SIZE`` messages or ``CONSUMER_BATCH_TIMEOUT_MS``.
+
+    A batch is applied in one transaction with a savepoint per message, so a failing message is nacked
+    while the rest of the batch is committed and acked together. A message failing with a transient
+    database error is requeued. Any other failure is permanent: the queues have no dead-letter exchange,
+    so the message is dropped and its body is logged at error level, the only record left of it.
+    """
+
+    def __init__(self, schema: type[BaseModel], handler: Callable[[AsyncSession, BaseModel], Awaitable[None]]):
+        self.schema = schema
+        self.handler = handler
+        self.prefetch_count = settings.CONSUMER_BATCH_SIZE * settings.CONSUMER_PREFETCH_BATCHES
+        self._messages: asyncio.Queue[AbstractIncomingMessage] = asyncio.Queue(maxsize=self.prefetch_count)
+        self._queue: AbstractQueue | None = None
+        self._consumer_tag: ConsumerTag | None = None
+        self._task: asyncio.Task | None = None
+        self._processing: asyncio.Task | None = None
+
+    async def start(self, queue: AbstractQueue):
+        self._queue = queue
+        # per consumer limit of unacked messages, the broker keeps the rest of the backlog
+        await queue.channel.set_qos(prefetch_count=self.prefetch_count)
+        self._consumer_tag = await queue.consume(self._messages.put)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops consuming, lets the batch in progress finish and returns the received messages to the queue.
+
+        Has to run while the broker connection is still open, so the messages can be acked or nacked.
+        """
+        if self._consumer_tag is not None:
+            await self._queue.cancel(self._consumer_tag)
+            self._consumer_tag = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._processing is not None:
+            await self._processing
+            self._processing = None
+        while not self._messages.empty():
+            await self._messages.get_nowait().nack(requeue=True)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # shielded, so a batch being applied is committed and acked even when stop() cancels the loop
+            self._processing = asyncio.create_task(self._process(batch))
+            await asyncio.shield(self._processing)
+
+    async def _collect(self) -> list[AbstractIncomingMessage]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._messages.get()]
+        deadline = loop.time() + settings.CONSUMER_BATCH_TIMEOUT_MS / 1000
+        try:
+            while len(batch) < settings.CONSUMER_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._messages.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            for message in batch:
+                await message.nack(requeue=True)
+            raise
+        return batch
+
+    async def _process(self, batch: list[AbstractIncomingMessage]):
+        requeued, dropped = [], []
+        try:
+            async with async_context_get_session() as session:
+                for message in batch:
+                    try:
+                        item = self.schema.model_validate_json(message.body)
+                        async with session.begin_nested():
+                            await self.handler(session, item)
+                    except Exception as e:
+                        if is_transient(e):
+                            logger.warning(f"Requeueing message {message.message_id} from {self._queue.name} "
+                                           f"after transient error: {e}")
+                            requeued.append(message)
+                        else:
+                            logger.exception(f"Dropping message {message.message_id} from {self._queue.name}, "
+                                             f"body: {message.body.decode(errors='replace')}")
+                            dropped.append(message)
+        except Exception:
+            logger.exception(f"Error committing batch of {len(batch)} messages from {self._queue.name}")
+            for message in batch:
+                await message.nack(requeue=True)
+            return
+
+        for message in batch:
+            if message in requeued:
+                await message.nack(requeue=True)
+            elif message in dropped:
+                await message.nack(requeue=False)
+            else:
+                await message.ack()
@@ -1,8 +1,14 @@
-from faststream.rabbit import RabbitBroker, RabbitExchange
+import asyncio
+import logging
+
+from aio_pika.exceptions import CONNECTION_EXCEPTIONS
+from faststream.rabbit import RabbitBroker, RabbitExchange, Channel
 
 from src.config import settings
 from src.events import CustomerCreditReservationEvent, CustomerNotFoundEvent, CustomerCreditLimitExceededEvent
 
+logger = logging.getLogger(__name__)
+
 events = [
     CustomerCreditReservationEvent,
     CustomerCreditLimitExceededEvent,
@@ -11,7 +17,7 @@ events = [
 
 
 def get_broker() -> RabbitBroker:
-    return RabbitBroker(settings.RABBITMQ_URL)
+    return RabbitBroker(settings.RABBITMQ_URL, default_channel=Channel(publisher_confirms=True))
 
 
 async def declare_exchanges(broker: RabbitBroker):
@@ -21,5 +27,49 @@ async def declare_exchanges(broker: RabbitBroker):
             exchanges.append(event.exchange)
 
     for exchange in exchanges:
-
         await broker.declare_exchange(RabbitExchange(exchange))
+
+
+class BrokerConnection:
+    """Owns one broker connection with declared exchanges for the whole process lifetime.
+
+    The underlying aio-pika connection is robust and restores itself after short outages, the
+    connection is rebuilt from scratch only when it could not be established or was reset.
+    """
+
+    def __init__(self, broker: RabbitBroker | None = None):
+        self.broker = broker or get_broker()
+        self._connected = False
+        self._lock = asyncio.Lock()
+
+    async def connect(self) -> RabbitBroker:
+        async with self._lock:
+            if not self._connected:
+                await self.broker.connect()
+                await declare_exchanges(self.broker)
+                self._connected = True
+        return self.broker
+
+    async def ensure_connected(self, timeout: float = settings.RABBITMQ_PING_TIMEOUT_SECONDS) -> RabbitBroker | None:
+        try:
+            broker = await self.connect()
+        except CONNECTION_EXCEPTIONS:
+            logger.exception("Could not connect to broker")
+            await self.reset()
+            return None
+
+        if not await broker.ping(timeout):
+            logger.error("Broker connection is not ready")
+            return None
+        return broker
+
+    async def reset(self):
+        async with self._lock:
+            self._connected = False
+            try:
+                await self.broker.close()
+            except CONNECTION_EXCEPTIONS:
+                logger.exception("Error closing broker connection")
+
+    async def close(self):
+        await self.reset()
@@ -1,3 +1,5 @@
+from typing import Self
+
 from pydantic import PostgresDsn, RedisDsn, model_validator, AmqpDsn
 from pydantic_settings import BaseSettings
 
@@ -7,7 +9,42 @@ from src.constants import Environment
 class Config(BaseSettings):
     DATABASE_URL: PostgresDsn
     DATABASE_ECHO: bool = False
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_RECYCLE_SECONDS: int = 1800
+    DATABASE_POOL_TIMEOUT_SECONDS: float = 30.0
+    DATABASE_POOL_PRE_PING: bool = True
+    DATABASE_READ_URL: PostgresDsn | None = None
+    DATABASE_READ_MAX_LAG_SECONDS: float = 5.0
+    DATABASE_READ_LAG_CHECK_SECONDS: float = 1.0
+    DATABASE_READ_CONNECT_TIMEOUT_SECONDS: float = 2.0
     RABBITMQ_URL: AmqpDsn | None = None
+    RABBITMQ_PING_TIMEOUT_SECONDS: float = 1.0
+
+    OUTBOX_FALLBACK_POLL_SECONDS: float = 60.0
+    OUTBOX_ERROR_BACKOFF_SECONDS: float = 1.0
+    OUTBOX_ERROR_BACKOFF_MAX_SECONDS: float = 30.0
+    OUTBOX_LISTENER_CLOSE_TIMEOUT_SECONDS: float = 5.0
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_WORKERS: int = 1
+    OUTBOX_PUBLISH_WINDOW: int = 100
+    OUTBOX_PUBLISH_TIMEOUT_SECONDS: float = 10.0
+    OUTBOX_DIRECT_PUBLISH: bool = False
+    OUTBOX_PARTITION_MONTHS_AHEAD: int = 3
+    OUTBOX_RETENTION_DAYS: int = 30
+    OUTBOX_MAINTENANCE_INTERVAL_HOURS: float = 6.0
+
+    CONSUMER_BATCH_SIZE: int = 1
+    CONSUMER_BATCH_TIMEOUT_MS: int = 50
+    CONSUMER_PREFETCH_BATCHES: int = 2
+
+    CREDIT_BUCKETS_ENABLED: bool = False
+    CREDIT_BUCKET_COUNT: int = 8
+    CREDIT_REBALANCE_INTERVAL_SECONDS: float = 5.0
+
+    PAGE_SIZE: int = 50
+    MAX_PAGE_SIZE: int = 500
+    EXPORT_CHUNK_SIZE: int = 1000
 
     SITE_DOMAIN: str = "myapp.com"
 
@@ -19,5 +56,14 @@ class Config(BaseSettings):
 
     APP_VERSION: str = "1.0"
 
+    TEST_DATABASE_URL: PostgresDsn | None = None
+
+
+    @model_validator(mode='after')
+    def check_test_database(self) -> Self:
+        if self.ENVIRONMENT == Environment.TESTING and not self.TEST_DATABASE_URL:
+            raise ValueError('Test database URL must be provided')
+        return self
+
 
 settings = Config()
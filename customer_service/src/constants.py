@@ -1,6 +1,12 @@
 from enum import Enum
 
+OUTBOX_NOTIFY_CHANNEL = "outbox_messages"
+JSON_CONTENT_TYPE = "application/json"
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+CSV_CONTENT_TYPE = "text/csv"
+
 
 class Environment(Enum):
     PRODUCTION = "production"
-    LOCAL = "local"
\ No newline at end of file
+    LOCAL = "local"
+    TESTING = "testing"
\ No newline at end of file
@@ -0,0 +1,91 @@
+import csv
+from typing import AsyncIterator
+
+from pydantic import ValidationError
+from sqlalchemy import column, func, insert, literal, select, table, text, Text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.constants import CSV_CONTENT_TYPE, JSON_CONTENT_TYPE, NDJSON_CONTENT_TYPE
+from src.events import CustomerCreatedEvent
+from src.models import Customer, OutboxMessageModel
+from src.schemas import CustomerCreateSchema
+from src.services import OutboxSaveService
+
+IMPORT_TABLE = "customer_import"
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode()
+    if buffer:
+        yield buffer.decode()
+
+
+async def parse_customers(lines: AsyncIterator[str], content_type: str) -> AsyncIterator[tuple[str, int]]:
+    """Yields ``(name, money_limit)`` rows from CSV with a header line or from NDJSON."""
+    if content_type not in (CSV_CONTENT_TYPE, NDJSON_CONTENT_TYPE):
+        raise ValueError(f"Unsupported import format {content_type}")
+
+    header = None
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if content_type == NDJSON_CONTENT_TYPE:
+                customer = CustomerCreateSchema.model_validate_json(line)
+            elif header is None:
+                header = next(csv.reader([line]))
+                continue
+            else:
+                customer = CustomerCreateSchema.model_validate(dict(zip(header, next(csv.reader([line])))))
+        except ValidationError as e:
+            raise ValueError(f"Invalid customer on line {line_number}: {e}") from e
+        yield customer.name, customer.money_limit
+
+
+async def import_customers(session: AsyncSession, customers: AsyncIterator[tuple[str, int]]) -> int:
+    """COPYs the customers into a temporary table and moves them into customers and outbox_messages.
+
+    Both inserts are one statement inside the session's transaction, so every imported customer
+    gets its CustomerCreatedEvent message or nothing is imported at all.
+    """
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+
+    await connection.execute(text(f"CREATE TEMPORARY TABLE {IMPORT_TABLE} "
+                                  f"(name varchar NOT NULL, money_limit integer NOT NULL) ON COMMIT DROP"))
+    await raw_connection.driver_connection.copy_records_to_table(
+        IMPORT_TABLE, records=customers, columns=["name", "money_limit"],
+    )
+
+    staged = table(IMPORT_TABLE, column("name"), column("money_limit"))
+    customers_table = Customer.__table__
+    inserted_customers = (
+        insert(customers_table)
+        .from_select(["name", "money_limit", "version_id"],
+                     select(staged.c.name, staged.c.money_limit, literal(1)))
+        .returning(customers_table.c.id, customers_table.c.name, customers_table.c.money_limit)
+        .cte("inserted_customers")
+    )
+    # same message body as OutboxMessageModel.serialize builds for CustomerCreatedEvent
+    payload = func.convert_to(
+        func.json_build_object("money_limit", inserted_customers.c.money_limit, "name", inserted_customers.c.name,
+                               "aggregate_id", inserted_customers.c.id).cast(Text),
+        "UTF8",
+    )
+    stmt = insert(OutboxMessageModel.__table__).from_select(
+        ["aggregate_id", "exchange", "key", "payload", "content_type"],
+        select(inserted_customers.c.id, literal(CustomerCreatedEvent.exchange), literal(CustomerCreatedEvent.key),
+               payload, literal(JSON_CONTENT_TYPE)),
+    )
+    result = await session.execute(stmt)
+
+    await OutboxSaveService(session).notify()
+    return result.rowcount
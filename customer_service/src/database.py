@@ -1,14 +1,168 @@
+import asyncio
+import logging
+import time
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy import text, event
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession, AsyncConnection
 
 from src.config import settings
 
+logger = logging.getLogger(__name__)
+
+_engine: AsyncEngine | None = None
+_replica_engine: AsyncEngine | None = None
+_primary_read_engine: AsyncEngine | None = None
+_replica_checked_at = 0.0
+_replica_fresh = False
+_replica_check_task: asyncio.Task | None = None
+
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+def _create_engine(url: str, **kwargs) -> AsyncEngine:
+    return create_async_engine(
+        url,
+        echo=settings.DATABASE_ECHO,
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE_SECONDS,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT_SECONDS,
+        pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+        **kwargs,
+    )
+
 
 def get_engine() -> AsyncEngine:
-    engine = create_async_engine(settings.DATABASE_URL.unicode_string(), echo=settings.DATABASE_ECHO)
-    return engine
+    """Returns the engine shared by the whole process, so every session reuses the same connection pool."""
+    global _engine
+    if _engine is None:
+        _engine = _create_engine(settings.DATABASE_URL.unicode_string())
+    return _engine
+
+
+def get_replica_engine() -> AsyncEngine | None:
+    """Returns the read-only engine of ``DATABASE_READ_URL``, None when no replica is configured."""
+    global _replica_engine
+    if _replica_engine is None and settings.DATABASE_READ_URL is not None:
+        _replica_engine = _create_engine(settings.DATABASE_READ_URL.unicode_string(),
+                                         execution_options={"postgresql_readonly": True},
+                                         connect_args={"timeout": settings.DATABASE_READ_CONNECT_TIMEOUT_SECONDS})
+        event.listen(_replica_engine.sync_engine, "handle_error", _on_replica_error)
+    return _replica_engine
+
+
+def get_primary_read_engine() -> AsyncEngine:
+    global _primary_read_engine
+    if _primary_read_engine is None:
+        _primary_read_engine = get_engine().execution_options(postgresql_readonly=True)
+    return _primary_read_engine
+
+
+def mark_replica_stale():
+    """Sends reads to the primary until the next lag check finds the replica fresh again."""
+    global _replica_fresh, _replica_checked_at
+    _replica_fresh = False
+    _replica_checked_at = time.monotonic()
+
+
+def _on_replica_error(context):
+    if context.is_disconnect:
+        mark_replica_stale()
+
+
+async def _check_replica(engine: AsyncEngine) -> bool:
+    try:
+        async with asyncio.timeout(settings.DATABASE_READ_CONNECT_TIMEOUT_SECONDS):
+            async with engine.connect() as connection:
+                lag = (await connection.execute(REPLICA_LAG_SQL)).scalar()
+    except (OSError, SQLAlchemyError):
+        logger.exception("Could not check the read replica lag")
+        return False
+    # NULL when the server is not replaying WAL at all, e.g. DATABASE_READ_URL points at the primary
+    if lag is not None and lag > settings.DATABASE_READ_MAX_LAG_SECONDS:
+        logger.warning(f"Read replica is {lag:.1f}s behind, reading from the primary")
+        return False
+    return True
+
+
+async def _refresh_replica(engine: AsyncEngine):
+    global _replica_fresh
+    _replica_fresh = await _check_replica(engine)
+
+
+def get_read_engine() -> AsyncEngine:
+    """Returns the replica engine while the last lag check found it within ``DATABASE_READ_MAX_LAG_SECONDS``,
+    the primary otherwise.
+
+    The lag is checked in a background task at most once per ``DATABASE_READ_LAG_CHECK_SECONDS``, so a slow or
+    unreachable replica never holds up a request. Both engines open read-only transactions.
+    """
+    global _replica_checked_at, _replica_check_task
+    replica_engine = get_replica_engine()
+    if replica_engine is not None:
+        now = time.monotonic()
+        if now - _replica_checked_at >= settings.DATABASE_READ_LAG_CHECK_SECONDS and (
+                _replica_check_task is None or _replica_check_task.done()):
+            _replica_checked_at = now
+            _replica_check_task = asyncio.create_task(_refresh_replica(replica_engine))
+        if _replica_fresh:
+            return replica_engine
+    return get_primary_read_engine()
+
+
+@asynccontextmanager
+async def connect_read() -> AsyncGenerator[AsyncConnection, None]:
+    """Connects with ``get_read_engine``, falling back to the primary when the replica cannot be reached."""
+    engine = get_read_engine()
+    try:
+        connection = await engine.connect()
+    except (OSError, SQLAlchemyError):
+        if engine is not _replica_engine:
+            raise
+        logger.exception("Could not connect to the read replica, reading from the primary")
+        mark_replica_stale()
+        connection = await get_primary_read_engine().connect()
+    try:
+        yield connection
+    finally:
+        await connection.close()
+
+
+async def init_engine():
+    async with get_engine().connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+async def dispose_engine():
+    global _engine, _replica_engine, _primary_read_engine, _replica_checked_at, _replica_fresh, _replica_check_task
+    if _replica_check_task is not None:
+        _replica_check_task.cancel()
+        _replica_check_task = None
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+    if _replica_engine is not None:
+        await _replica_engine.dispose()
+        _replica_engine = None
+    _primary_read_engine = None
+    _replica_checked_at = 0.0
+    _replica_fresh = False
+
+
+def get_pool_status() -> dict:
+    pool = get_engine().pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
 
 
 @asynccontextmanager
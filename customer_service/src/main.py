@@ -1,34 +1,116 @@
+from contextlib import asynccontextmanager
 from decimal import Decimal
 from typing import Any, Coroutine, Sequence
 
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Query, Request, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import TypeAdapter
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.depends import get_session, get_customer_service
-from src.models import Customer
-from src.schemas import CustomerShortSchema, CustomerSchema, CustomerCreateSchema
+from src.config import settings
+from src.customer_import import import_customers, iter_lines, parse_customers
+from src.database import init_engine, dispose_engine, get_engine, get_pool_status
+from src.depends import get_session, get_read_session, get_customer_service, direct_publisher
+from src.export import stream_ndjson
+from src.models import Customer, CreditReservation, OutboxMessageModel
+from src.partitions import ensure_monthly_partitions
+from src.schemas import CustomerShortSchema, CustomerPageSchema, CustomerSchema, CustomerCreateSchema, CustomerImportResultSchema, CreditReservationSchema, CreditReservationPageSchema, CreditBucketsCreateSchema, PoolStatusSchema
 from src.services import CustomerService
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_engine()
+    await ensure_monthly_partitions(get_engine(), {OutboxMessageModel.__tablename__: settings.OUTBOX_PARTITION_MONTHS_AHEAD})
+    if settings.OUTBOX_DIRECT_PUBLISH:
+        await direct_publisher.start()
+    yield
+    if settings.OUTBOX_DIRECT_PUBLISH:
+        await direct_publisher.stop()
+    await dispose_engine()
+
+
+app = FastAPI(lifespan=lifespan)
+
+customer_list_adapter = TypeAdapter(list[CustomerShortSchema])
+credit_reservation_list_adapter = TypeAdapter(list[CreditReservationSchema])
 
 
 
 @app.get("/customers")
-async def get_customers_list(session: AsyncSession = Depends(get_session)) -> Sequence[CustomerShortSchema]:
+async def get_customers_list(after_id: int | None = None, limit: int = Query(default=settings.PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+                             session: AsyncSession = Depends(get_read_session)) -> CustomerPageSchema:
     async with session.begin():
-        result = await session.execute(select(Customer).where(Customer.deleted_at.is_(None)))
-        return TypeAdapter(list[CustomerShortSchema]).validate_python(result.scalars().all(), from_attributes=True)
+        stmt = select(*Customer.columns_for(CustomerShortSchema))
+        if after_id is not None:
+            stmt = stmt.where(Customer.id > after_id)
+        result = await session.execute(stmt.order_by(Customer.id).limit(limit))
+        items = customer_list_adapter.validate_python(result.all(), from_attributes=True)
+        return CustomerPageSchema(items=items, next_cursor=items[-1].id if len(items) == limit else None)
+
+@app.get("/customers/export", response_class=StreamingResponse)
+async def export_customers() -> StreamingResponse:
+    # streamed on a plain connection, which the soft-delete filter of the session does not reach
+    stmt = (select(*Customer.columns_for(CustomerShortSchema))
+            .where(Customer.deleted_at.is_(None))
+            .order_by(Customer.id))
+    return StreamingResponse(stream_ndjson(stmt, CustomerShortSchema), media_type="application/x-ndjson")
 
 @app.get("/customers/{item_id}")
-async def get_customer(item_id: int, session: AsyncSession = Depends(get_session)) -> CustomerSchema:
+async def get_customer(item_id: int, session: AsyncSession = Depends(get_read_session)) -> CustomerSchema:
+    async with session.begin():
+        result = await session.execute(select(*Customer.columns_for(CustomerShortSchema))
+                                       .where(Customer.id == item_id))
+        customer = result.one_or_none()
+        if not customer:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        result = await session.execute(select(*CreditReservation.columns_for(CreditReservationSchema))
+                                       .where(CreditReservation.customer_id == item_id)
+                                       .order_by(CreditReservation.id)
+                                       .limit(settings.PAGE_SIZE))
+        credit_reservations = credit_reservation_list_adapter.validate_python(result.all(), from_attributes=True)
+        next_cursor = credit_reservations[-1].id if len(credit_reservations) == settings.PAGE_SIZE else None
+        return CustomerSchema(**customer._mapping, credit_reservations=credit_reservations,
+                              credit_reservations_next_cursor=next_cursor)
+
+@app.get("/customers/{item_id}/credit-reservations")
+async def get_customer_credit_reservations(item_id: int, after_id: int | None = None, limit: int = Query(default=settings.PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+                                           session: AsyncSession = Depends(get_read_session)) -> CreditReservationPageSchema:
     async with session.begin():
-        result = await session.execute(select(Customer).where(Customer.id == item_id, Customer.deleted_at.is_(None)))
-        return CustomerSchema.model_validate(result.scalar_one(), from_attributes=True)
+        stmt = select(*CreditReservation.columns_for(CreditReservationSchema)).where(
+            CreditReservation.customer_id == item_id)
+        if after_id is not None:
+            stmt = stmt.where(CreditReservation.id > after_id)
+        result = await session.execute(stmt.order_by(CreditReservation.id).limit(limit))
+        items = credit_reservation_list_adapter.validate_python(result.all(), from_attributes=True)
+        return CreditReservationPageSchema(items=items, next_cursor=items[-1].id if len(items) == limit else None)
 
 @app.post("/customers")
 async def create_customer(customer_in: CustomerCreateSchema, session: AsyncSession = Depends(get_session), customer_service: CustomerService = Depends(get_customer_service)) -> CustomerShortSchema:
     async with session.begin():
         customer = await customer_service.create_customer(customer_in)
         return CustomerShortSchema.model_validate(customer, from_attributes=True)
+
+@app.post("/customers/import")
+async def import_customers_from_body(request: Request, session: AsyncSession = Depends(get_session)) -> CustomerImportResultSchema:
+    """Imports customers from a CSV (with a name,money_limit header) or NDJSON request body."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        async with session.begin():
+            imported = await import_customers(session, parse_customers(iter_lines(request.stream()), content_type))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return CustomerImportResultSchema(imported=imported)
+
+
+@app.post("/customers/{item_id}/credit-buckets")
+async def enable_credit_buckets(item_id: int, buckets_in: CreditBucketsCreateSchema, session: AsyncSession = Depends(get_session), customer_service: CustomerService = Depends(get_customer_service)) -> CustomerShortSchema:
+    async with session.begin():
+        customer = await customer_service.enable_credit_buckets(item_id, buckets_in.bucket_count)
+        return CustomerShortSchema.model_validate(customer, from_attributes=True)
+
+
+@app.get("/health/db-pool")
+async def get_db_pool_status() -> PoolStatusSchema:
+    return PoolStatusSchema.model_validate(get_pool_status())
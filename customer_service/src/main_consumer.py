@@ -2,9 +2,11 @@ import asyncio
 
 from faststream import FastStream
 from faststream.rabbit import RabbitBroker, RabbitExchange, RabbitQueue
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.batching import BatchConsumer
 from src.config import settings
-from src.database import async_context_get_session
+from src.database import async_context_get_session, dispose_engine
 from src.schemas import OrderCreatedSchema, OrderCanceledSchema
 from src.services import CustomerService, OutboxSaveService
 
@@ -17,19 +19,34 @@ order_created_queue = RabbitQueue(name="customer.order_created")
 order_canceled_queue = RabbitQueue(name="customer.order_canceled")
 
 
-@broker.subscriber(order_created_queue)
-async def order_created(order: OrderCreatedSchema):
-    async with async_context_get_session() as session:
+async def apply_order_created(session: AsyncSession, order: OrderCreatedSchema):
+    service = CustomerService(session, OutboxSaveService(session))
+    await service.reserve_credit(order)
 
-        service = CustomerService(session, OutboxSaveService(session))
-        await service.reserve_credit(order)
 
-@broker.subscriber(order_canceled_queue)
-async def order_canceled(order_canceled_info: OrderCanceledSchema):
-    async with async_context_get_session() as session:
+async def apply_order_canceled(session: AsyncSession, order_canceled_info: OrderCanceledSchema):
+    service = CustomerService(session, OutboxSaveService(session))
+    await service.unreserve_credit(order_canceled_info)
 
-        service = CustomerService(session, OutboxSaveService(session))
-        await service.unreserve_credit(order_canceled_info)
+
+batch_mode = settings.CONSUMER_BATCH_SIZE > 1
+
+batch_consumers = {
+    order_created_queue.name: BatchConsumer(OrderCreatedSchema, apply_order_created),
+    order_canceled_queue.name: BatchConsumer(OrderCanceledSchema, apply_order_canceled),
+}
+
+
+if not batch_mode:
+    @broker.subscriber(order_created_queue)
+    async def order_created(order: OrderCreatedSchema):
+        async with async_context_get_session() as session:
+            await apply_order_created(session, order)
+
+    @broker.subscriber(order_canceled_queue)
+    async def order_canceled(order_canceled_info: OrderCanceledSchema):
+        async with async_context_get_session() as session:
+            await apply_order_canceled(session, order_canceled_info)
 
 
 @app.after_startup
@@ -42,7 +59,22 @@ async def declare_and_bind():
     await robust_order_created_queue.bind(robust_order_exchange, "order.created")
     await robust_order_canceled_queue.bind(robust_order_exchange, "order.canceled")
 
+    if batch_mode:
+        for robust_queue in (robust_order_created_queue, robust_order_canceled_queue):
+            await batch_consumers[robust_queue.name].start(robust_queue)
+
+
+@app.on_shutdown
+async def stop_batch_consumers():
+    # before the broker is closed, the last batches still have to be acked
+    for consumer in batch_consumers.values():
+        await consumer.stop()
+
+
+@app.after_shutdown
+async def close_database():
+    await dispose_engine()
 
 
 if __name__ == "__main__":
-    asyncio.run(app.run())
\ No newline at end of file
+    asyncio.run(app.run())
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import select
+
+from src.config import settings
+from src.database import async_context_get_session, dispose_engine
+from src.models import Customer
+from src.services import CustomerService, OutboxSaveService
+
+logger = logging.getLogger(__name__)
+
+
+async def rebalance_credit_buckets():
+    """Rebalances the buckets of every customer that has them, or merges them back while buckets are disabled."""
+    async with async_context_get_session() as session:
+        result = await session.execute(
+            select(Customer.id).where(Customer.credit_bucket_count > 0)
+        )
+        customer_ids = result.scalars().all()
+
+    # one short transaction per customer, so reservations of other customers are never blocked
+    for customer_id in customer_ids:
+        try:
+            async with async_context_get_session() as session:
+                service = CustomerService(session, OutboxSaveService(session))
+                if settings.CREDIT_BUCKETS_ENABLED:
+                    await service.rebalance_credit_buckets(customer_id)
+                else:
+                    await service.merge_credit_buckets(customer_id)
+        except Exception:
+            logger.exception(f"Error rebalancing credit buckets of customer {customer_id}")
+
+
+async def main():
+    scheduler = AsyncIOScheduler()
+
+    scheduler.add_job(rebalance_credit_buckets, trigger="interval", seconds=settings.CREDIT_REBALANCE_INTERVAL_SECONDS,
+                      max_instances=1)
+
+    scheduler.start()
+
+    try:
+        while True:
+            await asyncio.sleep(1000)
+    finally:
+        scheduler.shutdown()
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
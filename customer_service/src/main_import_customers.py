@@ -0,0 +1,40 @@
+import argparse
+import asyncio
+import logging
+from typing import AsyncIterator
+
+from src.constants import CSV_CONTENT_TYPE, NDJSON_CONTENT_TYPE
+from src.customer_import import import_customers, parse_customers
+from src.database import async_context_get_session, dispose_engine
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"csv": CSV_CONTENT_TYPE, "ndjson": NDJSON_CONTENT_TYPE}
+
+
+async def read_lines(path: str) -> AsyncIterator[str]:
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            yield line
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Imports customers from a CSV (name,money_limit header) or NDJSON file")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="defaults to the file extension")
+    args = parser.parse_args()
+
+    file_format = args.format or args.path.rsplit(".", 1)[-1].lower()
+    if file_format not in FORMATS:
+        parser.error(f"Unknown format {file_format}, pass --format")
+
+    try:
+        async with async_context_get_session() as session:
+            imported = await import_customers(session, parse_customers(read_lines(args.path), FORMATS[file_format]))
+        logger.info(f"Imported {imported} customers from {args.path}")
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
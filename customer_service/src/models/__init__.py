@@ -1,27 +1,52 @@
-import copy
 import datetime
+import json
 import logging
 
-from sqlalchemy import func, Integer, ForeignKey, JSON, orm
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from pydantic import BaseModel
+from sqlalchemy import func, Integer, ForeignKey, orm, Index, text, DDL, LargeBinary, event
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, Session, ORMExecuteState, \
+    with_loader_criteria
 
-from src.events import Event, CustomerCreditReservationEvent, CustomerCreditLimitExceededEvent, CustomerCreatedEvent
-from src.schemas import OrderCreatedSchema
+from src.constants import JSON_CONTENT_TYPE
+from src.events import Event, CustomerCreatedEvent
 
 logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
-    pass
+    @classmethod
+    def columns_for(cls, schema: type[BaseModel]) -> list:
+        """Columns ``schema`` is built from, selecting them returns plain rows instead of loaded instances."""
+        return [getattr(cls, name) for name in schema.model_fields]
 
 class BaseClass:
     id: Mapped[int] = mapped_column(primary_key=True)
     created_at: Mapped[datetime.datetime] = mapped_column(default=func.now())
-    deleted_at: Mapped[datetime.datetime | None]
+    deleted_at: Mapped[datetime.datetime | None] = mapped_column(default=None)
     updated_at: Mapped[datetime.datetime | None] = mapped_column(
         default=func.now(),
         onupdate=func.current_timestamp(),
     )
 
+@event.listens_for(Session, "do_orm_execute")
+def _filter_soft_deleted(execute_state: ORMExecuteState):
+    """Hides soft-deleted rows from every ORM SELECT, the ``include_deleted`` execution option turns it off.
+
+    Registered with the models so it applies to every session using them. Refreshes and lazy relationship
+    loads are not filtered, eager loaders like ``selectinload`` copy the options of the statement and are.
+    Core statements run on a plain connection and DML are not filtered either, those keep an explicit
+    ``deleted_at`` condition.
+    """
+    if (
+        execute_state.is_select
+        and not execute_state.is_column_load
+        and not execute_state.is_relationship_load
+        and not execute_state.execution_options.get("include_deleted", False)
+    ):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(BaseClass, lambda cls: cls.deleted_at.is_(None), include_aliases=True,
+                                 propagate_to_loaders=False)
+        )
+
 class Versioned:
     version_id = mapped_column(Integer, nullable=False)
 
@@ -47,10 +72,15 @@ class Eventable:
 
 class Customer(Eventable, Base, BaseClass, Versioned, ):
     __tablename__ = "customers"
+    __table_args__ = (
+        Index("ix_customers_live_id", "id", postgresql_where=text("deleted_at IS NULL")),
+    )
 
     name: Mapped[str]
     money_limit: Mapped[int]
-    credit_reservations: Mapped[list["CreditReservation"]] = relationship(back_populates="customer", lazy="selectin",
+    # when above zero the credit lives in that many credit_buckets rows and money_limit is their synced total
+    credit_bucket_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    credit_reservations: Mapped[list["CreditReservation"]] = relationship(back_populates="customer", lazy="raise",
                                                                           primaryjoin="and_(Customer.id == CreditReservation.customer_id, CreditReservation.deleted_at.is_(None))",)
 
     @staticmethod
@@ -59,58 +89,74 @@ class Customer(Eventable, Base, BaseClass, Versioned, ):
         customer._add_domain_event(CustomerCreatedEvent(customer.money_limit, name=name))
         return customer
 
-    def reserve_credit(self, order: OrderCreatedSchema):
-        if order.order_total <= self.money_limit:
-            self.credit_reservations.append(CreditReservation.create(order))
-            self.money_limit -= order.order_total
-
-            self._add_domain_event(CustomerCreditReservationEvent(order.aggregate_id))
-        else:
-            self._add_domain_event(CustomerCreditLimitExceededEvent(order.aggregate_id))
-
-    def unreserve_credit(self, order_id):
-        for credit_reservation in self.credit_reservations:
-            if credit_reservation.order_id == order_id:
-                credit_reservation.deleted_at = datetime.datetime.now()
-                break
-
-        else:
-            logger.error(f"Credit reservation with order_id {order_id} for customer {self.id} not found")
-
-
+    @staticmethod
+    def split_credit(total: int, bucket_count: int) -> list[int]:
+        """Splits ``total`` into ``bucket_count`` amounts that differ by at most one."""
+        share, remainder = divmod(total, bucket_count)
+        return [share + 1 if i < remainder else share for i in range(bucket_count)]
 
 
 class CreditReservation(Base, BaseClass):
     __tablename__ = "credit_reservations"
+    __table_args__ = (
+        Index("ix_credit_reservations_active_customer_order", "customer_id", "order_id",
+              postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_credit_reservations_active_customer_id", "customer_id", "id",
+              postgresql_where=text("deleted_at IS NULL")),
+    )
 
     order_id: Mapped[int]
     customer_id: Mapped[int] = mapped_column(ForeignKey("customers.id"))
+    credit_bucket_id: Mapped[int | None] = mapped_column(ForeignKey("credit_buckets.id"), default=None)
 
     customer: Mapped[Customer] = relationship(back_populates="credit_reservations")
     amount: Mapped[int]
 
-    @staticmethod
-    def create(order: OrderCreatedSchema) -> "CreditReservation":
-        return CreditReservation(order_id=order.aggregate_id, amount=order.order_total)
+
+class CreditBucket(Base, BaseClass):
+    """Share of a hot customer's credit, reservations lock one bucket instead of the customer row."""
+    __tablename__ = "credit_buckets"
+
+    customer_id: Mapped[int] = mapped_column(ForeignKey("customers.id"), index=True)
+    amount: Mapped[int]
+
 
 class OutboxMessageModel(Base, BaseClass):
     __tablename__ = "outbox_messages"
+    __table_args__ = (
+        Index("ix_outbox_messages_unprocessed", "id", postgresql_where=text("processed_on IS NULL")),
+        # earlier unprocessed messages of an aggregate, checked when claiming
+        Index("ix_outbox_messages_unprocessed_aggregate_id", "aggregate_id", "id",
+              postgresql_where=text("processed_on IS NULL")),
+        {
+            "postgresql_partition_by": "RANGE (created_at)",
+            # rows outside of the monthly partitions land here instead of failing the insert
+            "listeners": [("after_create", DDL("CREATE TABLE IF NOT EXISTS outbox_messages_default "
+                                               "PARTITION OF outbox_messages DEFAULT").execute_if(dialect="postgresql"))],
+        },
+    )
 
+    # partitioned by created_at, so it has to be a part of the primary key
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(primary_key=True, default=func.now())
     exchange: Mapped[str]
     key: Mapped[str]
     aggregate_id: Mapped[int]
-    data: Mapped[dict] = mapped_column(type_=JSON)
+    # final message body, published to the broker as is
+    payload: Mapped[bytes] = mapped_column(type_=LargeBinary)
+    content_type: Mapped[str] = mapped_column(default=JSON_CONTENT_TYPE)
     processed_on: Mapped[datetime.datetime | None] = mapped_column(default=None)
 
 
-    def get_data_with_aggregate_id(self) -> dict:
-        data_copy = copy.deepcopy(self.data)
-        data_copy["aggregate_id"] = self.aggregate_id
-        return data_copy
+    @staticmethod
+    def serialize(aggregate_id, event: "Event") -> bytes:
+        return json.dumps({**event.data, "aggregate_id": aggregate_id}, separators=(",", ":")).encode()
 
     @staticmethod
     def create(aggregate_id, event: "Event") -> "OutboxMessageModel":
-        return OutboxMessageModel(aggregate_id=aggregate_id, exchange=event.exchange, key=event.key, data=event.data)
+        return OutboxMessageModel(aggregate_id=aggregate_id, exchange=event.exchange, key=event.key,
+                                  payload=OutboxMessageModel.serialize(aggregate_id, event), content_type=JSON_CONTENT_TYPE)
 
     def __repr__(self):
-        return f"src.models.OutboxMessageModel ({self.data=} {self.exchange=} {self.key=})"
+        return f"src.models.OutboxMessageModel ({self.payload=} {self.exchange=} {self.key=})"
+
@@ -0,0 +1,125 @@
+import datetime
+import logging
+import re
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+PARTITION_KEY = "created_at"
+
+
+def month_start(value: datetime.date) -> datetime.date:
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(value: datetime.date, months: int) -> datetime.date:
+    month_index = value.year * 12 + value.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime.date) -> str:
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+def create_partition_sql(table: str, month: datetime.date) -> str:
+    return (f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+
+
+async def create_partition(connection: AsyncConnection, table: str, month: datetime.date):
+    """Creates the partition of ``month``, moving rows of that month out of the default partition.
+
+    Postgres refuses to create a partition while the default partition holds rows of its range, which
+    happens when rows were inserted before the partition was created in time.
+    """
+    default = f"{table}_default"
+    in_range = (f"{PARTITION_KEY} >= '{month.isoformat()}' "
+                f"AND {PARTITION_KEY} < '{add_months(month, 1).isoformat()}'")
+    has_default = await connection.scalar(text("SELECT to_regclass(:default) IS NOT NULL"), {"default": default})
+    if has_default:
+        has_default_rows = await connection.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})"))
+    if not has_default or not has_default_rows:
+        await connection.execute(text(create_partition_sql(table, month)))
+        return
+
+    logger.warning(f"Moving rows of {month:%Y-%m} from {default} into {partition_name(table, month)}")
+    await connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    await connection.execute(text(create_partition_sql(table, month)))
+    await connection.execute(text(f"WITH moved AS (DELETE FROM {default} WHERE {in_range} RETURNING *) "
+                                  f"INSERT INTO {table} SELECT * FROM moved"))
+    await connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+
+
+async def create_monthly_partitions(connection: AsyncConnection, table: str, months_ahead: int) -> list[str]:
+    """Makes sure partitions exist for the current month and ``months_ahead`` months after it.
+
+    Several processes create partitions on startup, they take turns on an advisory lock of the table.
+    """
+    await connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:table))"), {"table": table})
+    await connection.execute(text("SET LOCAL lock_timeout = '5s'"))
+
+    existing = await get_monthly_partitions(connection, table)
+    current = month_start(datetime.date.today())
+    months = [add_months(current, i) for i in range(months_ahead + 1)]
+    for month in months:
+        if partition_name(table, month) not in existing:
+            await create_partition(connection, table, month)
+    return [partition_name(table, month) for month in months]
+
+
+async def ensure_monthly_partitions(engine: AsyncEngine, months_ahead: dict[str, int]):
+    """Creates missing partitions of every table in ``months_ahead``, each table in its own transaction.
+
+    Called on startup of the processes writing to the tables, so inserts do not rely on a single maintenance
+    process having created the partitions in time. Errors are logged, the maintenance jobs retry later.
+    """
+    for table, table_months_ahead in months_ahead.items():
+        try:
+            async with engine.begin() as connection:
+                await create_monthly_partitions(connection, table, table_months_ahead)
+        except (OSError, SQLAlchemyError):
+            logger.exception(f"Could not create partitions of {table}")
+
+
+async def get_monthly_partitions(connection: AsyncConnection, table: str) -> dict[str, datetime.date]:
+    """Returns monthly partitions of ``table`` with the first day of the month each one holds."""
+    result = await connection.execute(
+        text("SELECT child.relname FROM pg_inherits "
+             "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+             "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+             "WHERE parent.relname = :table"),
+        {"table": table},
+    )
+    pattern = re.compile(rf"^{re.escape(table)}_p(\d{{4}})_(\d{{2}})$")
+    partitions = {}
+    for name in result.scalars():
+        match = pattern.match(name)
+        if match:
+            partitions[name] = datetime.date(int(match.group(1)), int(match.group(2)), 1)
+    return partitions
+
+
+async def drop_monthly_partitions(connection: AsyncConnection, table: str, before: datetime.date,
+                                  keep_if: str | None = None) -> list[str]:
+    """Detaches and drops partitions holding only rows older than ``before``.
+
+    A partition that still has a row matching the ``keep_if`` SQL condition is kept.
+    """
+    await connection.execute(text("SET LOCAL lock_timeout = '5s'"))
+
+    dropped = []
+    for name, month in sorted((await get_monthly_partitions(connection, table)).items()):
+        if add_months(month, 1) > before:
+            continue
+        if keep_if is not None:
+            result = await connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE {keep_if})"))
+            if result.scalar():
+                logger.warning(f"Partition {name} is past retention but still has rows matching {keep_if}")
+                continue
+        await connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        await connection.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Mapped
 
 
@@ -7,17 +7,38 @@ class CustomerShortSchema(BaseModel):
     name: str
     money_limit: float
 
+class CustomerPageSchema(BaseModel):
+    items: list[CustomerShortSchema]
+    # pass as after_id to get the next page, None on the last page
+    next_cursor: int | None
+
 class CreditReservationSchema(BaseModel):
+    id: int
+    order_id: int
     amount: float
 
+class CreditReservationPageSchema(BaseModel):
+    items: list[CreditReservationSchema]
+    # pass as after_id to get the next page, None on the last page
+    next_cursor: int | None
+
 
 class CustomerSchema(CustomerShortSchema):
+    # first page only, the rest is read from /customers/{id}/credit-reservations starting after this cursor
     credit_reservations: list[CreditReservationSchema]
+    credit_reservations_next_cursor: int | None
 
 class CustomerCreateSchema(BaseModel):
     name: str
     money_limit: int
 
+class CustomerImportResultSchema(BaseModel):
+    imported: int
+
+class CreditBucketsCreateSchema(BaseModel):
+    # defaults to CREDIT_BUCKET_COUNT
+    bucket_count: int | None = Field(default=None, gt=0)
+
 
 class OrderCreatedSchema(BaseModel):
     aggregate_id: int
@@ -26,4 +47,10 @@ class OrderCreatedSchema(BaseModel):
 
 class OrderCanceledSchema(BaseModel):
     aggregate_id: int
-    customer_id: int
\ No newline at end of file
+    customer_id: int
+
+class PoolStatusSchema(BaseModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
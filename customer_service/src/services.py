@@ -1,13 +1,20 @@
+import asyncio
 import datetime
 import logging
+from typing import Sequence
 
+from aio_pika.exceptions import DeliveryError
+from fastapi import HTTPException
 from faststream.exceptions import FastStreamException
 from faststream.rabbit import RabbitBroker
-from sqlalchemy import select
+from sqlalchemy import select, update, insert, delete, func, exists, inspect, literal
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
-from src.events import Event, CustomerNotFoundEvent
-from src.models import OutboxMessageModel, Customer
+from src.config import settings
+from src.constants import OUTBOX_NOTIFY_CHANNEL
+from src.events import Event, CustomerNotFoundEvent, CustomerCreditReservationEvent, CustomerCreditLimitExceededEvent
+from src.models import OutboxMessageModel, Customer, CreditReservation, CreditBucket
 from src.schemas import CustomerCreateSchema, OrderCreatedSchema, OrderCanceledSchema
 
 logger = logging.getLogger(__name__)
@@ -29,30 +36,236 @@ class CustomerService(BaseService):
         return customer
 
     async def reserve_credit(self, order: OrderCreatedSchema):
+        """Reserves credit with one statement, so the cost does not grow with the customer's reservations.
 
-        stmt = select(Customer).where(Customer.id == order.customer_id and Customer.deleted_at.is_(None))
+        The customer row is decremented only when its limit covers the order, and the reservation
+        is inserted from the updated row in the same statement. Customers with credit buckets are
+        skipped here and reserve from their buckets instead. The credit rules live only in these
+        statements, ``Customer`` has no in-memory counterpart.
+        """
+        # the soft-delete filter of the session covers ORM SELECTs only, not these DML statements
+        reserved_customer = (
+            update(Customer)
+            .where(Customer.id == order.customer_id, Customer.deleted_at.is_(None), Customer.credit_bucket_count == 0,
+                   Customer.money_limit >= order.order_total)
+            .values(money_limit=Customer.money_limit - order.order_total, version_id=Customer.version_id + 1)
+            .returning(Customer.id)
+            .cte("reserved_customer")
+        )
+        stmt = (
+            insert(CreditReservation.__table__)
+            .from_select(["order_id", "customer_id", "amount"],
+                         select(literal(order.aggregate_id), reserved_customer.c.id, literal(order.order_total)))
+            .returning(CreditReservation.__table__.c.id)
+        )
         result = await self.session.execute(stmt)
-        customer = result.scalar_one_or_none()
-        if not customer:
-            await self.events_save_service.save(order.customer_id, CustomerNotFoundEvent(order.aggregate_id))
+        reserved = result.scalar_one_or_none() is not None
+
+        if not reserved:
+            bucket_count = await self.session.scalar(
+                select(Customer.credit_bucket_count).where(Customer.id == order.customer_id)
+            )
+            if bucket_count is None:
+                await self.events_save_service.save(order.customer_id, CustomerNotFoundEvent(order.aggregate_id))
+                return
+            # buckets are used whenever the customer has them, also after CREDIT_BUCKETS_ENABLED was turned off
+            # and until the rebalancer has merged them back
+            if bucket_count:
+                reserved = await self._reserve_with_buckets(order)
+
+        if reserved:
+            await self.events_save_service.save(order.customer_id, CustomerCreditReservationEvent(order.aggregate_id))
             return
 
-        customer.reserve_credit(order)
-        await self.events_save_service.save(customer.id, customer.events)
-        self.session.add(customer)
-        await self.session.commit()
+        await self.events_save_service.save(order.customer_id, CustomerCreditLimitExceededEvent(order.aggregate_id))
+
+    async def _reserve_with_buckets(self, order: OrderCreatedSchema) -> bool:
+        # a free bucket first, then wait for a busy one, and only then take the total from several buckets,
+        # so an order the customer's credit covers is never reported as limit exceeded
+        return (await self._reserve_from_bucket(order, skip_locked=True)
+                or await self._reserve_from_bucket(order, skip_locked=False)
+                or await self._reserve_across_buckets(order))
+
+    async def _reserve_from_bucket(self, order: OrderCreatedSchema, skip_locked: bool) -> bool:
+        # part of an INSERT, which the soft-delete filter of the session does not reach
+        bucket = (
+            select(CreditBucket.id)
+            .join(Customer, Customer.id == CreditBucket.customer_id)
+            .where(CreditBucket.customer_id == order.customer_id, CreditBucket.amount >= order.order_total,
+                   Customer.deleted_at.is_(None))
+            .order_by(CreditBucket.amount.desc())
+            .limit(1)
+            .with_for_update(of=CreditBucket, skip_locked=skip_locked)
+            .cte("bucket")
+        )
+        reserved_bucket = (
+            update(CreditBucket)
+            .where(CreditBucket.id == bucket.c.id)
+            .values(amount=CreditBucket.amount - order.order_total)
+            .returning(CreditBucket.id)
+            .cte("reserved_bucket")
+        )
+        stmt = (
+            insert(CreditReservation.__table__)
+            .from_select(["order_id", "customer_id", "amount", "credit_bucket_id"],
+                         select(literal(order.aggregate_id), literal(order.customer_id), literal(order.order_total),
+                                reserved_bucket.c.id))
+            .returning(CreditReservation.__table__.c.id)
+        )
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none() is not None
+
+    async def _reserve_across_buckets(self, order: OrderCreatedSchema) -> bool:
+        """Takes the order total from several buckets, largest first, when no single bucket covers it.
+
+        Locks all of the customer's buckets. The reservation is not tied to a bucket, so its amount
+        goes back to the customer's first bucket when released.
+        """
+        result = await self.session.execute(
+            select(CreditBucket)
+            .join(Customer, Customer.id == CreditBucket.customer_id)
+            .where(CreditBucket.customer_id == order.customer_id)
+            .order_by(CreditBucket.id)
+            .with_for_update(of=CreditBucket)
+            .execution_options(populate_existing=True)
+        )
+        buckets = result.scalars().all()
+        if sum(bucket.amount for bucket in buckets) < order.order_total:
+            return False
+
+        remaining = order.order_total
+        for bucket in sorted(buckets, key=lambda bucket: bucket.amount, reverse=True):
+            taken = min(bucket.amount, remaining)
+            bucket.amount -= taken
+            remaining -= taken
+            if not remaining:
+                break
+        self.session.add(CreditReservation(order_id=order.aggregate_id, customer_id=order.customer_id,
+                                           amount=order.order_total))
+        await self.session.flush()
+        return True
 
     async def unreserve_credit(self, order_canceled_info: OrderCanceledSchema):
-        result = await self.session.execute(select(Customer).where(Customer.id == order_canceled_info.customer_id and Customer.deleted_at.is_(None)))
+        """Soft-deletes the order's reservation and returns its amount in one statement.
+
+        The amount goes back to the bucket it was taken from, to the customer's first bucket when the
+        reservation predates the buckets, or to the customer row when the customer has no buckets.
+        """
+        released_reservation = (
+            update(CreditReservation)
+            .where(CreditReservation.customer_id == order_canceled_info.customer_id,
+                   CreditReservation.order_id == order_canceled_info.aggregate_id,
+                   CreditReservation.deleted_at.is_(None))
+            .values(deleted_at=func.now())
+            .returning(CreditReservation.customer_id, CreditReservation.amount, CreditReservation.credit_bucket_id)
+            .cte("released_reservation")
+        )
+        first_bucket = (
+            select(func.min(CreditBucket.id))
+            .where(CreditBucket.customer_id == released_reservation.c.customer_id)
+            .correlate_except(CreditBucket)
+            .scalar_subquery()
+        )
+        restored_bucket = (
+            update(CreditBucket)
+            .where(CreditBucket.id == func.coalesce(released_reservation.c.credit_bucket_id, first_bucket))
+            .values(amount=CreditBucket.amount + released_reservation.c.amount)
+            .cte("restored_bucket")
+        )
+        restored_customer = (
+            update(Customer)
+            .where(Customer.id == released_reservation.c.customer_id, Customer.credit_bucket_count == 0)
+            .values(money_limit=Customer.money_limit + released_reservation.c.amount,
+                    version_id=Customer.version_id + 1)
+            .cte("restored_customer")
+        )
+        stmt = select(released_reservation.c.customer_id).add_cte(restored_bucket, restored_customer)
+        result = await self.session.execute(stmt)
+        if result.scalar_one_or_none() is None:
+            logger.error(f"Credit reservation with order_id {order_canceled_info.aggregate_id} "
+                         f"for customer {order_canceled_info.customer_id} not found")
+
+    async def enable_credit_buckets(self, customer_id: int, bucket_count: int | None = None) -> Customer:
+        """Moves the customer's credit into ``bucket_count`` buckets, so reservations stop contending on its row."""
+        if not settings.CREDIT_BUCKETS_ENABLED:
+            raise HTTPException(status_code=400, detail="Credit buckets are disabled")
+
+        result = await self.session.execute(
+            select(Customer).where(Customer.id == customer_id).with_for_update()
+        )
         customer = result.scalar_one_or_none()
         if not customer:
-            logger.error(f"No customer found with id {order_canceled_info.customer_id}")
-        customer.unreserve_credit(order_canceled_info.aggregate_id)
+            raise HTTPException(status_code=404, detail="Customer not found")
+        if customer.credit_bucket_count:
+            raise HTTPException(status_code=409, detail="Customer already has credit buckets")
+
+        bucket_count = bucket_count or settings.CREDIT_BUCKET_COUNT
+
+        self.session.add_all([CreditBucket(customer_id=customer.id, amount=amount)
+                              for amount in Customer.split_credit(customer.money_limit, bucket_count)])
+        customer.credit_bucket_count = bucket_count
+        await self.session.flush()
+        return customer
+
+    async def rebalance_credit_buckets(self, customer_id: int):
+        """Evens out the customer's buckets and syncs ``money_limit`` with their total.
+
+        Holds the locks on all of the customer's buckets, reservations for it wait until the transaction ends.
+        """
+        result = await self.session.execute(
+            select(CreditBucket).where(CreditBucket.customer_id == customer_id)
+            .order_by(CreditBucket.id).with_for_update()
+        )
+        buckets = result.scalars().all()
+        if not buckets:
+            return
+
+        total = sum(bucket.amount for bucket in buckets)
+        for bucket, amount in zip(buckets, Customer.split_credit(total, len(buckets))):
+            bucket.amount = amount
+        await self.session.execute(
+            update(Customer)
+            .where(Customer.id == customer_id, Customer.money_limit != total)
+            .values(money_limit=total, version_id=Customer.version_id + 1)
+            .execution_options(synchronize_session=False)
+        )
+        await self.session.flush()
+
+    async def merge_credit_buckets(self, customer_id: int):
+        """Moves the credit of the customer's buckets back into ``money_limit`` and removes the buckets.
+
+        Reservations taken from a bucket are released to ``money_limit`` afterwards.
+        """
+        result = await self.session.execute(
+            select(CreditBucket).where(CreditBucket.customer_id == customer_id)
+            .order_by(CreditBucket.id).with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        buckets = result.scalars().all()
+        bucket_ids = [bucket.id for bucket in buckets]
+
+        await self.session.execute(
+            update(CreditReservation)
+            .where(CreditReservation.customer_id == customer_id, CreditReservation.credit_bucket_id.in_(bucket_ids))
+            .values(credit_bucket_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        await self.session.execute(
+            delete(CreditBucket).where(CreditBucket.id.in_(bucket_ids)).execution_options(synchronize_session=False)
+        )
+        await self.session.execute(
+            update(Customer)
+            .where(Customer.id == customer_id)
+            .values(money_limit=sum(bucket.amount for bucket in buckets), credit_bucket_count=0,
+                    version_id=Customer.version_id + 1)
+            .execution_options(synchronize_session=False)
+        )
 
 
 class OutboxSaveService:
     def __init__(self, session: AsyncSession):
         self.session = session
+        self.saved: list[OutboxMessageModel] = []
 
     async def save(self, aggregate_id: int, events: list[Event] | Event):
         if isinstance(events, Event):
@@ -61,23 +274,113 @@ class OutboxSaveService:
         for i in outbox_models:
             logger.error("Saved event: %s", repr(i))
         self.session.add_all(outbox_models)
+        self.saved.extend(outbox_models)
+        if outbox_models:
+            await self.notify()
+
+    def saved_ids(self) -> list[int]:
+        """Ids of the saved messages which were flushed and not rolled back, read without a database round-trip."""
+        states = (inspect(message) for message in self.saved)
+        return [state.identity[0] for state in states if state.identity is not None]
+
+    async def notify(self):
+        """Wakes up the relay, Postgres delivers the notification only when the transaction commits."""
+        await self.session.execute(select(func.pg_notify(OUTBOX_NOTIFY_CHANNEL, "")))
 
 class OutboxPublishService:
     def __init__(self, session: AsyncSession, broker: RabbitBroker):
         self.session = session
         self.broker = broker
 
-    async def publish_all(self):
-        stmt = select(OutboxMessageModel).where(OutboxMessageModel.processed_on.is_(None))
+    async def claim(self, limit: int, ids: list[int] | None = None) -> Sequence[OutboxMessageModel]:
+        """Locks a batch of unprocessed messages, rows locked by other relay workers are skipped.
+
+        Every aggregate in the batch is also locked for the rest of the transaction, so messages of one
+        aggregate are never split between concurrent workers and keep their order. A message is claimed
+        only together with all earlier unprocessed messages of its aggregate, so it cannot overtake one
+        which is row-locked by another worker. When ``ids`` are given only those messages are claimed.
+        """
+        candidates = select(OutboxMessageModel).where(OutboxMessageModel.processed_on.is_(None))
+        if ids is not None:
+            candidates = candidates.where(OutboxMessageModel.id.in_(ids))
+        candidates = (
+            candidates
+            .order_by(OutboxMessageModel.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .cte("candidates")
+            .prefix_with("MATERIALIZED")
+        )
+        candidate = aliased(OutboxMessageModel, candidates)
+        earlier = aliased(OutboxMessageModel)
+        # materialized as well, so aggregates are locked only for messages which passed the check
+        ready = (
+            select(candidate)
+            .where(~exists().where(
+                earlier.aggregate_id == candidate.aggregate_id,
+                earlier.processed_on.is_(None),
+                earlier.id < candidate.id,
+                earlier.id.not_in(select(candidates.c.id)),
+            ))
+            .cte("ready")
+            .prefix_with("MATERIALIZED")
+        )
+        claimed = aliased(OutboxMessageModel, ready)
+        stmt = (
+            select(claimed)
+            .where(func.pg_try_advisory_xact_lock(func.hashtext(OutboxMessageModel.__tablename__), claimed.aggregate_id))
+            .order_by(claimed.id)
+        )
 
         result = await self.session.execute(stmt)
-        items = result.scalars().all()
+        return result.scalars().all()
+
+    async def publish(self, items: Sequence[OutboxMessageModel]) -> list[int]:
+        """Publishes messages keeping up to ``OUTBOX_PUBLISH_WINDOW`` of them awaiting a publisher confirm.
+
+        Messages are split into one lane per aggregate, lanes run concurrently and each lane publishes
+        in order. Returns ids of the confirmed messages, nacked or failed ones stay unprocessed and are
+        claimed again.
+        """
+        lanes: dict[int, list[OutboxMessageModel]] = {}
         for event in items:
+            lanes.setdefault(event.aggregate_id, []).append(event)
+
+        window = asyncio.Semaphore(settings.OUTBOX_PUBLISH_WINDOW)
+        # every lane has to stop before an error reaches the caller, which then unlocks the claimed rows
+        results = await asyncio.gather(*(self._publish_lane(lane, window) for lane in lanes.values()),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return [event_id for lane_ids in results for event_id in lane_ids]
+
+    async def _publish_lane(self, lane: list[OutboxMessageModel], window: asyncio.Semaphore) -> list[int]:
+        published_ids = []
+        for event in lane:
+            # later messages of the aggregate must not overtake the failed one
+            if not await self._publish_one(event, window):
+                break
+            published_ids.append(event.id)
+        return published_ids
+
+    async def _publish_one(self, event: OutboxMessageModel, window: asyncio.Semaphore) -> bool:
+        async with window:
             try:
-                await self.broker.publish(event.get_data_with_aggregate_id(), exchange=event.exchange, routing_key=event.key)
-                logger.error("Published event: %s", repr(event))
-            except FastStreamException:
+                await self.broker.publish(event.payload, exchange=event.exchange, routing_key=event.key,
+                                          content_type=event.content_type, timeout=settings.OUTBOX_PUBLISH_TIMEOUT_SECONDS)
+            except (FastStreamException, DeliveryError, asyncio.TimeoutError):
                 logger.exception(f"Error publishing outbox message message_id {event.id}")
-                continue
-            event.processed_on = datetime.datetime.now()
-            self.session.add(event)
+                return False
+        logger.error("Published event: %s", repr(event))
+        return True
+
+    async def mark_processed(self, ids: list[int]):
+        if not ids:
+            return
+        stmt = (
+            update(OutboxMessageModel)
+            .where(OutboxMessageModel.id.in_(ids))
+            .values(processed_on=datetime.datetime.now())
+        )
+        await self.session.execute(stmt, execution_options={"synchronize_session": False})
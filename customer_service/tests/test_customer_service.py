@@ -0,0 +1,153 @@
+import json
+
+import pytest
+from sqlalchemy import select
+
+from src.config import settings
+from src.constants import CSV_CONTENT_TYPE
+from src.customer_import import import_customers, parse_customers
+from src.events import CustomerCreatedEvent, CustomerCreditReservationEvent, CustomerCreditLimitExceededEvent, \
+    CustomerNotFoundEvent
+from src.models import Customer, CreditReservation, CreditBucket, OutboxMessageModel
+from src.schemas import CustomerCreateSchema, OrderCreatedSchema, OrderCanceledSchema
+
+
+async def get_money_limit(session, customer_id: int) -> int:
+    return await session.scalar(select(Customer.money_limit).where(Customer.id == customer_id))
+
+
+async def get_active_reservations(session, customer_id: int) -> list[tuple[int, int]]:
+    result = await session.execute(
+        select(CreditReservation.order_id, CreditReservation.amount)
+        .where(CreditReservation.customer_id == customer_id, CreditReservation.deleted_at.is_(None))
+        .order_by(CreditReservation.id)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+def saved_keys(customer_service) -> list[str]:
+    return [message.key for message in customer_service.events_save_service.saved]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_reserve_credit_within_limit(customer_service, db_session):
+    customer = await customer_service.create_customer(CustomerCreateSchema(name="test", money_limit=100))
+
+    await customer_service.reserve_credit(OrderCreatedSchema(aggregate_id=1, customer_id=customer.id, order_total=60))
+
+    assert await get_money_limit(db_session, customer.id) == 40
+    assert await get_active_reservations(db_session, customer.id) == [(1, 60)]
+    assert saved_keys(customer_service)[-1] == CustomerCreditReservationEvent.key
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_reserve_credit_over_limit(customer_service, db_session):
+    customer = await customer_service.create_customer(CustomerCreateSchema(name="test", money_limit=100))
+
+    await customer_service.reserve_credit(OrderCreatedSchema(aggregate_id=1, customer_id=customer.id, order_total=101))
+
+    assert await get_money_limit(db_session, customer.id) == 100
+    assert await get_active_reservations(db_session, customer.id) == []
+    assert saved_keys(customer_service)[-1] == CustomerCreditLimitExceededEvent.key
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_reserve_credit_for_unknown_customer(customer_service, db_session):
+    await customer_service.reserve_credit(OrderCreatedSchema(aggregate_id=1, customer_id=-1, order_total=10))
+
+    assert saved_keys(customer_service) == [CustomerNotFoundEvent.key]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_unreserve_credit_twice_restores_once(customer_service, db_session):
+    customer = await customer_service.create_customer(CustomerCreateSchema(name="test", money_limit=100))
+    await customer_service.reserve_credit(OrderCreatedSchema(aggregate_id=1, customer_id=customer.id, order_total=60))
+    await customer_service.reserve_credit(OrderCreatedSchema(aggregate_id=2, customer_id=customer.id, order_total=30))
+
+    canceled = OrderCanceledSchema(aggregate_id=1, customer_id=customer.id)
+    await customer_service.unreserve_credit(canceled)
+    await customer_service.unreserve_credit(canceled)
+
+    assert await get_money_limit(db_session, customer.id) == 70
+    assert await get_active_reservations(db_session, customer.id) == [(2, 30)]
+
+
+async def get_bucket_amounts(session, customer_id: int) -> list[int]:
+    result = await session.execute(
+        select(CreditBucket.amount).where(CreditBucket.customer_id == customer_id).order_by(CreditBucket.id)
+    )
+    return list(result.scalars().all())
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_reserve_credit_from_buckets(customer_service, db_session, monkeypatch):
+    monkeypatch.setattr(settings, "CREDIT_BUCKETS_ENABLED", True)
+    customer = await customer_service.create_customer(CustomerCreateSchema(name="test", money_limit=100))
+    await customer_service.enable_credit_buckets(customer.id, bucket_count=4)
+
+    await customer_service.reserve_credit(OrderCreatedSchema(aggregate_id=1, customer_id=customer.id, order_total=20))
+
+    assert sorted(await get_bucket_amounts(db_session, customer.id)) == [5, 25, 25, 25]
+    assert await get_active_reservations(db_session, customer.id) == [(1, 20)]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_reserve_credit_across_buckets_when_no_bucket_covers_order(customer_service, db_session, monkeypatch):
+    monkeypatch.setattr(settings, "CREDIT_BUCKETS_ENABLED", True)
+    customer = await customer_service.create_customer(CustomerCreateSchema(name="test", money_limit=100))
+    await customer_service.enable_credit_buckets(customer.id, bucket_count=4)
+
+    await customer_service.reserve_credit(OrderCreatedSchema(aggregate_id=1, customer_id=customer.id, order_total=90))
+    await customer_service.reserve_credit(OrderCreatedSchema(aggregate_id=2, customer_id=customer.id, order_total=11))
+
+    assert sum(await get_bucket_amounts(db_session, customer.id)) == 10
+    assert await get_active_reservations(db_session, customer.id) == [(1, 90)]
+    assert saved_keys(customer_service)[-2:] == [CustomerCreditReservationEvent.key,
+                                                 CustomerCreditLimitExceededEvent.key]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_merge_credit_buckets_after_disabling_them(customer_service, db_session, monkeypatch):
+    monkeypatch.setattr(settings, "CREDIT_BUCKETS_ENABLED", True)
+    customer = await customer_service.create_customer(CustomerCreateSchema(name="test", money_limit=100))
+    await customer_service.enable_credit_buckets(customer.id, bucket_count=4)
+    await customer_service.reserve_credit(OrderCreatedSchema(aggregate_id=1, customer_id=customer.id, order_total=20))
+    monkeypatch.setattr(settings, "CREDIT_BUCKETS_ENABLED", False)
+
+    await customer_service.reserve_credit(OrderCreatedSchema(aggregate_id=2, customer_id=customer.id, order_total=30))
+    await customer_service.merge_credit_buckets(customer.id)
+    await customer_service.unreserve_credit(OrderCanceledSchema(aggregate_id=1, customer_id=customer.id))
+
+    assert await get_bucket_amounts(db_session, customer.id) == []
+    assert await get_money_limit(db_session, customer.id) == 70
+    assert await get_active_reservations(db_session, customer.id) == [(2, 30)]
+
+
+async def lines_of(text: str):
+    for line in text.splitlines():
+        yield line
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_import_customers_from_csv(db_session):
+    imported = await import_customers(db_session, parse_customers(lines_of("name,money_limit\nann,10\nbob,20\n"),
+                                                                  CSV_CONTENT_TYPE))
+
+    result = await db_session.execute(select(Customer.id, Customer.name, Customer.money_limit)
+                                      .where(Customer.name.in_(["ann", "bob"])).order_by(Customer.name))
+    customers = result.all()
+    assert imported == 2
+    assert [(customer.name, customer.money_limit) for customer in customers] == [("ann", 10), ("bob", 20)]
+
+    result = await db_session.execute(select(OutboxMessageModel.payload)
+                                      .where(OutboxMessageModel.aggregate_id == customers[0].id,
+                                             OutboxMessageModel.key == CustomerCreatedEvent.key))
+    assert json.loads(result.scalar_one()) == {"money_limit": 10, "name": "ann", "aggregate_id": customers[0].id}
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_import_customers_rejects_file_with_bad_row(db_session):
+    lines = lines_of("name,money_limit\ncarl,10\ndora,lots\n")
+
+    with pytest.raises(ValueError, match="line 3"):
+        await import_customers(db_session, parse_customers(lines, CSV_CONTENT_TYPE))
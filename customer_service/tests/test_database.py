@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import selectinload
+
+from src.models import Customer, CreditReservation, CreditBucket
+from src.schemas import CustomerCreateSchema, OrderCreatedSchema
+
+
+async def create_reservation_of_deleted_customer(customer_service, db_session) -> Customer:
+    customer = await customer_service.create_customer(CustomerCreateSchema(name="test", money_limit=100))
+    await customer_service.reserve_credit(OrderCreatedSchema(aggregate_id=1, customer_id=customer.id, order_total=60))
+    await db_session.execute(update(Customer).where(Customer.id == customer.id).values(deleted_at=func.now()))
+    db_session.expunge(customer)
+    return customer
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_lazy_relationship_load_returns_soft_deleted_row(customer_service, db_session):
+    customer = await create_reservation_of_deleted_customer(customer_service, db_session)
+    reservation = await db_session.scalar(select(CreditReservation).where(CreditReservation.customer_id == customer.id))
+
+    loaded = await db_session.run_sync(lambda session: reservation.customer)
+
+    assert loaded.id == customer.id
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_eager_relationship_load_hides_soft_deleted_row(customer_service, db_session):
+    customer = await create_reservation_of_deleted_customer(customer_service, db_session)
+
+    reservation = await db_session.scalar(select(CreditReservation)
+                                          .where(CreditReservation.customer_id == customer.id)
+                                          .options(selectinload(CreditReservation.customer)))
+
+    assert reservation.customer is None
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_soft_deleted_rows_are_hidden_from_joined_entities(customer_service, db_session):
+    customer = await customer_service.create_customer(CustomerCreateSchema(name="test", money_limit=100))
+    db_session.add(CreditBucket(customer_id=customer.id, amount=100))
+    await db_session.execute(update(Customer).where(Customer.id == customer.id).values(deleted_at=func.now()))
+
+    result = await db_session.execute(select(CreditBucket)
+                                      .join(Customer, Customer.id == CreditBucket.customer_id)
+                                      .where(CreditBucket.customer_id == customer.id))
+
+    assert result.scalars().all() == []
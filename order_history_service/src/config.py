@@ -6,6 +6,9 @@ from src.constants import Environment
 
 class Config(BaseSettings):
     DATABASE_URL: MongoDsn
+    DATABASE_MAX_POOL_SIZE: int = 100
+    DATABASE_MIN_POOL_SIZE: int = 1
+    DATABASE_MAX_IDLE_TIME_MS: int | None = None
     RABBITMQ_URL: AmqpDsn | None = None
 
     SITE_DOMAIN: str = "myapp.com"
@@ -4,11 +4,36 @@ from pymongo.asynchronous.database import AsyncDatabase
 
 from src.config import settings
 
+_client: AsyncMongoClient | None = None
+
+
+def get_client() -> AsyncMongoClient:
+    """Returns the client shared by the whole process, so every request and message reuses its connection pool."""
+    global _client
+    if _client is None:
+        _client = AsyncMongoClient(
+            settings.DATABASE_URL.unicode_string(),
+            maxPoolSize=settings.DATABASE_MAX_POOL_SIZE,
+            minPoolSize=settings.DATABASE_MIN_POOL_SIZE,
+            maxIdleTimeMS=settings.DATABASE_MAX_IDLE_TIME_MS,
+        )
+    return _client
+
+
+async def init_client():
+    # runs server discovery and opens the first pooled connection before any traffic arrives
+    await get_client().admin.command("ping")
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
 
 async def get_database() -> AsyncDatabase:
-    client = AsyncMongoClient(settings.DATABASE_URL.unicode_string())
-    db = client.orders_history_service
-    return db
+    return get_client().orders_history_service
 
 async def get_order_history_collection() -> AsyncCollection:
     db = await get_database()
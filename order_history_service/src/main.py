@@ -1,11 +1,21 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Depends, HTTPException
 from pymongo.asynchronous.collection import AsyncCollection
 from fastapi import status
 
-from src.database import  get_order_history_collection
+from src.database import get_order_history_collection, init_client, close_client
 from src.schemas import  CustomerOrderHistorySchema
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_client()
+    yield
+    await close_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/customers/{item_id}/orderhistory")
@@ -8,7 +8,7 @@ from pymongo.asynchronous.collection import AsyncCollection
 
 from src.config import settings
 from src.constants import OrderState, RejectionReason
-from src.database import get_order_history_collection
+from src.database import get_order_history_collection, init_client, close_client
 from src.schemas import CustomerCreatedSchema, OrderCreatedSchema, CreditReservationSchema
 
 logger = logging.getLogger(__name__)
@@ -101,6 +101,11 @@ async def order_created(order: OrderCreatedSchema, collection: AsyncCollection =
 #         await service.customer_credit_limit_exceeded(order_info)
 #
 
+@app.on_startup
+async def open_database():
+    await init_client()
+
+
 @app.after_startup
 async def declare_and_bind():
     robust_customer_exchange = await broker.declare_exchange(customer_exchange)
@@ -119,6 +124,10 @@ async def declare_and_bind():
     await robust_order_created_queue.bind(robust_order_exchange, "order.created")
 
 
+@app.after_shutdown
+async def close_database():
+    await close_client()
+
 
 if __name__ == "__main__":
     asyncio.run(app.run())
\ No newline at end of file
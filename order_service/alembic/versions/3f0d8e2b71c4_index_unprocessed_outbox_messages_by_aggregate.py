@@ -0,0 +1,30 @@
+"""index unprocessed outbox messages by aggregate
+
+Revision ID: 3f0d8e2b71c4
+Revises: e26e3a3940bc
+Create Date: 2026-10-18 16:02:51.337406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f0d8e2b71c4'
+down_revision: Union[str, None] = 'e26e3a3940bc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_outbox_messages_unprocessed_aggregate_id', 'outbox_messages', ['aggregate_id', 'id'],
+                    unique=False, postgresql_where=sa.text('processed_on IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_outbox_messages_unprocessed_aggregate_id', table_name='outbox_messages',
+                  postgresql_where=sa.text('processed_on IS NULL'))
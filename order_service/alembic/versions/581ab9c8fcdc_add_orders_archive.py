@@ -0,0 +1,44 @@
+"""add orders archive
+
+Revision ID: 581ab9c8fcdc
+Revises: 759d44283904
+Create Date: 2026-10-18 14:47:03.551926
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '581ab9c8fcdc'
+down_revision: Union[str, None] = '759d44283904'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('orders_archive',
+    sa.Column('state', postgresql.ENUM(name='orderstate', create_type=False), nullable=False),
+    sa.Column('rejection_reason', postgresql.ENUM(name='rejectionreason', create_type=False), nullable=True),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('order_total', sa.Integer(), nullable=False),
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('version_id', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("INSERT INTO orders (state, rejection_reason, customer_id, order_total, id, created_at, deleted_at, "
+               "updated_at, version_id) SELECT state, rejection_reason, customer_id, order_total, id, created_at, "
+               "deleted_at, updated_at, version_id FROM orders_archive")
+    op.drop_table('orders_archive')
@@ -0,0 +1,32 @@
+"""index live orders for keyset pagination
+
+Revision ID: 6851a9b5d798
+Revises: 26a4e99cfa04
+Create Date: 2026-10-18 13:10:52.640118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6851a9b5d798'
+down_revision: Union[str, None] = '26a4e99cfa04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_orders_live_customer_id_id', 'orders', ['customer_id', 'id'],
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.create_index('ix_orders_live_state_id', 'orders', ['state', 'id'],
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_orders_live_state_id', table_name='orders')
+    op.drop_index('ix_orders_live_customer_id_id', table_name='orders')
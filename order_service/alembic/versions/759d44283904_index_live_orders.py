@@ -0,0 +1,28 @@
+"""index live orders
+
+Revision ID: 759d44283904
+Revises: 6851a9b5d798
+Create Date: 2026-10-18 14:21:37.905513
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '759d44283904'
+down_revision: Union[str, None] = '6851a9b5d798'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_orders_live_id', 'orders', ['id'], postgresql_where=sa.text('deleted_at IS NULL'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_orders_live_id', table_name='orders')
@@ -0,0 +1,29 @@
+"""index archivable orders
+
+Revision ID: b8e2f4a61d3c
+Revises: 3f0d8e2b71c4
+Create Date: 2026-10-18 16:41:09.582114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e2f4a61d3c'
+down_revision: Union[str, None] = '3f0d8e2b71c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_orders_archivable_last_change', 'orders', [sa.text('coalesce(updated_at, created_at)')],
+                    postgresql_where=sa.text("state IN ('APPROVED', 'REJECTED', 'CANCELLED')"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_orders_archivable_last_change', table_name='orders')
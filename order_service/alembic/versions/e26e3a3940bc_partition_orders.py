@@ -0,0 +1,94 @@
+"""partition orders by created_at
+
+Revision ID: e26e3a3940bc
+Revises: 581ab9c8fcdc
+Create Date: 2026-10-18 15:08:44.126379
+
+"""
+import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e26e3a3940bc'
+down_revision: Union[str, None] = '581ab9c8fcdc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = "id, created_at, state, rejection_reason, customer_id, order_total, deleted_at, updated_at, version_id"
+PARTITIONS_AHEAD_MONTHS = 12
+LIVE = sa.text('deleted_at IS NULL')
+
+
+def add_months(value: datetime.date, months: int) -> datetime.date:
+    month_index = value.year * 12 + value.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def create_orders_table(**kwargs) -> None:
+    op.create_table('orders',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('orders_id_seq'::regclass)"), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('state', postgresql.ENUM(name='orderstate', create_type=False), nullable=False),
+    sa.Column('rejection_reason', postgresql.ENUM(name='rejectionreason', create_type=False), nullable=True),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('order_total', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('version_id', sa.Integer(), nullable=False),
+    **kwargs
+    )
+
+
+def create_orders_indexes() -> None:
+    op.create_index('ix_orders_live_id', 'orders', ['id'], postgresql_where=LIVE)
+    op.create_index('ix_orders_live_customer_id_id', 'orders', ['customer_id', 'id'], postgresql_where=LIVE)
+    op.create_index('ix_orders_live_state_id', 'orders', ['state', 'id'], postgresql_where=LIVE)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("ALTER TABLE orders RENAME TO orders_unpartitioned")
+    op.execute("ALTER TABLE orders_unpartitioned RENAME CONSTRAINT orders_pkey TO orders_unpartitioned_pkey")
+    for index in ('ix_orders_live_id', 'ix_orders_live_customer_id_id', 'ix_orders_live_state_id'):
+        op.execute(f"ALTER INDEX {index} RENAME TO {index}_unpartitioned")
+
+    create_orders_table(postgresql_partition_by='RANGE (created_at)')
+    op.create_primary_key('orders_pkey', 'orders', ['id', 'created_at'])
+
+    oldest = op.get_bind().execute(sa.text("SELECT min(created_at) FROM orders_unpartitioned")).scalar()
+    today = datetime.date.today()
+    month = datetime.date((oldest or today).year, (oldest or today).month, 1)
+    last_month = add_months(datetime.date(today.year, today.month, 1), PARTITIONS_AHEAD_MONTHS)
+    while month <= last_month:
+        op.execute(f"CREATE TABLE orders_p{month.year:04d}_{month.month:02d} PARTITION OF orders "
+                   f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+        month = add_months(month, 1)
+    op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT")
+
+    op.execute(f"INSERT INTO orders ({COLUMNS}) SELECT {COLUMNS} FROM orders_unpartitioned")
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.drop_table('orders_unpartitioned')
+
+    create_orders_indexes()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE orders RENAME TO orders_partitioned")
+    op.execute("ALTER TABLE orders_partitioned RENAME CONSTRAINT orders_pkey TO orders_partitioned_pkey")
+    for index in ('ix_orders_live_id', 'ix_orders_live_customer_id_id', 'ix_orders_live_state_id'):
+        op.execute(f"ALTER INDEX {index} RENAME TO {index}_partitioned")
+
+    create_orders_table()
+    op.create_primary_key('orders_pkey', 'orders', ['id'])
+
+    op.execute(f"INSERT INTO orders ({COLUMNS}) SELECT {COLUMNS} FROM orders_partitioned")
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.drop_table('orders_partitioned')
+
+    create_orders_indexes()
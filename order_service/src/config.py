@@ -9,7 +9,46 @@ from src.constants import Environment
 class Config(BaseSettings):
     DATABASE_URL: PostgresDsn
     DATABASE_ECHO: bool = False
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_RECYCLE_SECONDS: int = 1800
+    DATABASE_POOL_TIMEOUT_SECONDS: float = 30.0
+    DATABASE_POOL_PRE_PING: bool = True
+    DATABASE_READ_URL: PostgresDsn | None = None
+    DATABASE_READ_MAX_LAG_SECONDS: float = 5.0
+    DATABASE_READ_LAG_CHECK_SECONDS: float = 1.0
+    DATABASE_READ_CONNECT_TIMEOUT_SECONDS: float = 2.0
     RABBITMQ_URL: AmqpDsn | None = None
+    RABBITMQ_PING_TIMEOUT_SECONDS: float = 1.0
+
+    OUTBOX_FALLBACK_POLL_SECONDS: float = 60.0
+    OUTBOX_ERROR_BACKOFF_SECONDS: float = 1.0
+    OUTBOX_ERROR_BACKOFF_MAX_SECONDS: float = 30.0
+    OUTBOX_LISTENER_CLOSE_TIMEOUT_SECONDS: float = 5.0
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_WORKERS: int = 1
+    OUTBOX_PUBLISH_WINDOW: int = 100
+    OUTBOX_PUBLISH_TIMEOUT_SECONDS: float = 10.0
+    OUTBOX_DIRECT_PUBLISH: bool = False
+    OUTBOX_PARTITION_MONTHS_AHEAD: int = 3
+    OUTBOX_RETENTION_DAYS: int = 30
+    OUTBOX_MAINTENANCE_INTERVAL_HOURS: float = 6.0
+
+    CONSUMER_BATCH_SIZE: int = 1
+    CONSUMER_BATCH_TIMEOUT_MS: int = 50
+    CONSUMER_PREFETCH_BATCHES: int = 2
+
+    PAGE_SIZE: int = 50
+    MAX_PAGE_SIZE: int = 500
+    EXPORT_CHUNK_SIZE: int = 1000
+    ORDER_BATCH_MAX_SIZE: int = 10000
+
+    ORDER_ARCHIVE_AFTER_DAYS: int = 30
+    ORDER_ARCHIVE_APPROVED_AFTER_DAYS: int = 180
+    ORDER_ARCHIVE_BATCH_SIZE: int = 1000
+    ORDER_ARCHIVE_INTERVAL_SECONDS: float = 600.0
+    ORDER_PARTITION_MONTHS_AHEAD: int = 3
+    ORDER_PARTITION_INTERVAL_HOURS: float = 6.0
 
     SITE_DOMAIN: str = "myapp.com"
 
@@ -1,5 +1,8 @@
 from enum import Enum
 
+OUTBOX_NOTIFY_CHANNEL = "outbox_messages"
+JSON_CONTENT_TYPE = "application/json"
+
 
 class Environment(Enum):
     PRODUCTION = "production"
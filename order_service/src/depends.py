@@ -1,11 +1,15 @@
 from typing import AsyncGenerator
 
-from fastapi import Depends
+from fastapi import Depends, BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine
 
-from src.database import get_engine
+from src.config import settings
+from src.database import get_engine, connect_read
+from src.relay import OutboxDirectPublisher
 from src.services import OrderService, OutboxSaveService
 
+direct_publisher = OutboxDirectPublisher()
+
 
 async def get_session(engine:AsyncEngine =  Depends(get_engine)) -> AsyncGenerator[AsyncSession, None]:
     db = AsyncSession(
@@ -16,8 +20,25 @@ async def get_session(engine:AsyncEngine =  Depends(get_engine)) -> AsyncGenerat
     finally:
         await db.close()
 
-async def get_outbox_save_service(session: AsyncSession = Depends(get_session)) -> OutboxSaveService:
-    return OutboxSaveService(session)
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    async with connect_read() as connection:
+        db = AsyncSession(
+            bind=connection,
+        )
+        try:
+            yield db
+        finally:
+            await db.close()
+
+async def get_outbox_save_service(background_tasks: BackgroundTasks, session: AsyncSession = Depends(get_session)) -> AsyncGenerator[OutboxSaveService, None]:
+    outbox_save_service = OutboxSaveService(session)
+    yield outbox_save_service
+    # runs only when the endpoint did not raise, the messages are published after the response is sent
+    if settings.OUTBOX_DIRECT_PUBLISH and (saved_ids := outbox_save_service.saved_ids()):
+        background_tasks.add_task(direct_publisher.publish, saved_ids)
 
 async def get_order_service(session: AsyncSession = Depends(get_session), outbox_save_service: OutboxSaveService = Depends(get_outbox_save_service)) -> OrderService:
     return OrderService(session, outbox_save_service)
+
+async def get_read_order_service(session: AsyncSession = Depends(get_read_session)) -> OrderService:
+    return OrderService(session, OutboxSaveService(session))
@@ -0,0 +1,19 @@
+from typing import AsyncIterator
+
+from pydantic import BaseModel
+from sqlalchemy import Select
+
+from src.config import settings
+from src.database import connect_read
+
+
+async def stream_ndjson(stmt: Select, schema: type[BaseModel]) -> AsyncIterator[bytes]:
+    """Streams rows of ``stmt`` from a server-side cursor as NDJSON, one chunk per ``EXPORT_CHUNK_SIZE`` rows.
+
+    Uses its own connection, the request session is already closed while the response body is sent.
+    """
+    async with connect_read() as connection:
+        result = await connection.stream(stmt.execution_options(yield_per=settings.EXPORT_CHUNK_SIZE))
+        async for rows in result.partitions():
+            yield b"".join(schema.model_validate(row, from_attributes=True).model_dump_json().encode() + b"\n"
+                           for row in rows)
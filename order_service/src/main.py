@@ -1,29 +1,66 @@
-from typing import Sequence
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import TypeAdapter
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from src.depends import get_session, get_order_service
-from src.models import Order
-from src.schemas import OrderSchema, OrderCreateSchema
+from src.config import settings
+from src.database import init_engine, dispose_engine, get_engine, get_pool_status
+from src.depends import get_session, get_read_session, get_order_service, get_read_order_service, direct_publisher
+from src.export import stream_ndjson
+from src.models import Order, OutboxMessageModel
+from src.constants import OrderState
+from src.partitions import ensure_monthly_partitions
+from src.schemas import OrderSchema, OrderExportSchema, OrderPageSchema, OrderCreateSchema, OrderBatchCreatedSchema, PoolStatusSchema
 from src.services import OrderService
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_engine()
+    await ensure_monthly_partitions(get_engine(), {Order.__tablename__: settings.ORDER_PARTITION_MONTHS_AHEAD,
+                                                   OutboxMessageModel.__tablename__: settings.OUTBOX_PARTITION_MONTHS_AHEAD})
+    if settings.OUTBOX_DIRECT_PUBLISH:
+        await direct_publisher.start()
+    yield
+    if settings.OUTBOX_DIRECT_PUBLISH:
+        await direct_publisher.stop()
+    await dispose_engine()
+
+
+app = FastAPI(lifespan=lifespan)
+
+order_list_adapter = TypeAdapter(list[OrderSchema])
 
 
 @app.get("/orders")
-async def get_orders_list(session: AsyncSession = Depends(get_session), order_service: OrderService = Depends(get_order_service)) -> Sequence[OrderSchema]:
+async def get_orders_list(after_id: int | None = None, limit: int = Query(default=settings.PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+                          customer_id: int | None = None, state: OrderState | None = None,
+                          session: AsyncSession = Depends(get_read_session), order_service: OrderService = Depends(get_read_order_service)) -> OrderPageSchema:
     async with session.begin():
-        orders = await order_service.get_list()
+        orders = await order_service.get_list(limit, after_id=after_id, customer_id=customer_id, state=state)
+
+        items = order_list_adapter.validate_python(orders, from_attributes=True)
+        return OrderPageSchema(items=items, next_cursor=items[-1].id if len(items) == limit else None)
 
-        return TypeAdapter(list[OrderSchema]).validate_python(orders, from_attributes=True)
+
+@app.get("/orders/export", response_class=StreamingResponse)
+async def export_orders(customer_id: int | None = None, state: OrderState | None = None) -> StreamingResponse:
+    # streamed on a plain connection, which the soft-delete filter of the session does not reach
+    stmt = (select(Order.id, Order.state, Order.rejection_reason, Order.customer_id, Order.order_total, Order.created_at)
+            .where(Order.deleted_at.is_(None)))
+    if customer_id is not None:
+        stmt = stmt.where(Order.customer_id == customer_id)
+    if state is not None:
+        stmt = stmt.where(Order.state == state)
+    return StreamingResponse(stream_ndjson(stmt.order_by(Order.id), OrderExportSchema), media_type="application/x-ndjson")
 
 
 @app.get("/orders/{item_id}")
-async def get_order(item_id: int, session: AsyncSession = Depends(get_session), order_service: OrderService = Depends(get_order_service)) -> OrderSchema:
+async def get_order(item_id: int, session: AsyncSession = Depends(get_read_session), order_service: OrderService = Depends(get_read_order_service)) -> OrderSchema:
     async with session.begin():
         order = await order_service.get_order_by_id(item_id)
 
@@ -37,8 +74,19 @@ async def create_order(order_in: OrderCreateSchema, session: AsyncSession = Depe
         return OrderSchema.model_validate(result, from_attributes=True)
 
 
+@app.post("/orders/batch")
+async def create_orders_batch(orders_in: list[OrderCreateSchema], session: AsyncSession = Depends(get_session), order_service: OrderService = Depends(get_order_service)) -> OrderBatchCreatedSchema:
+    async with session.begin():
+        order_ids = await order_service.create_orders(orders_in)
+        return OrderBatchCreatedSchema(ids=order_ids)
+
+
 @app.post("/orders/{item_id}/cancel/", status_code=status.HTTP_204_NO_CONTENT)
 async def cancel_order(order_id: int, session: AsyncSession = Depends(get_session), order_service: OrderService = Depends(get_order_service)):
     async with session.begin():
         await order_service.cancel_order(order_id)
 
+
+@app.get("/health/db-pool")
+async def get_db_pool_status() -> PoolStatusSchema:
+    return PoolStatusSchema.model_validate(get_pool_status())
@@ -2,9 +2,12 @@ import asyncio
 
 from faststream import FastStream
 from faststream.rabbit import RabbitExchange, RabbitQueue
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.batching import BatchConsumer
 from src.broker import get_broker
-from src.database import async_context_get_session
+from src.config import settings
+from src.database import async_context_get_session, dispose_engine
 from src.schemas import (CustomerNotFoundConsumerSchema, CustomerCreditReservationConsumerSchema,
                          CustomerCreditLimitExceededConsumerSchema)
 from src.services import OutboxSaveService, OrderService
@@ -19,25 +22,47 @@ customer_credit_reservation_queue = RabbitQueue(name="order.customer_credit_rese
 customer_credit_limit_exceeded_queue = RabbitQueue(name="order.customer_credit_limit_exceeded")
 
 
-@broker.subscriber(customer_not_found_queue)
-async def customer_not_found(order_info: CustomerNotFoundConsumerSchema):
-    async with async_context_get_session() as session:
-        service = OrderService(session, OutboxSaveService(session))
-        await service.customer_not_found(order_info)
+async def apply_customer_not_found(session: AsyncSession, order_info: CustomerNotFoundConsumerSchema):
+    service = OrderService(session, OutboxSaveService(session))
+    await service.customer_not_found(order_info)
 
 
-@broker.subscriber(customer_credit_reservation_queue)
-async def credit_reservation(order_info: CustomerCreditReservationConsumerSchema):
-    async with async_context_get_session() as session:
-        service = OrderService(session, OutboxSaveService(session))
-        await service.customer_credit_reservation(order_info)
+async def apply_credit_reservation(session: AsyncSession, order_info: CustomerCreditReservationConsumerSchema):
+    service = OrderService(session, OutboxSaveService(session))
+    await service.customer_credit_reservation(order_info)
 
 
-@broker.subscriber(customer_credit_limit_exceeded_queue)
-async def credit_limit_exceeded(order_info: CustomerCreditLimitExceededConsumerSchema):
-    async with async_context_get_session() as session:
-        service = OrderService(session, OutboxSaveService(session))
-        await service.customer_credit_limit_exceeded(order_info)
+async def apply_credit_limit_exceeded(session: AsyncSession, order_info: CustomerCreditLimitExceededConsumerSchema):
+    service = OrderService(session, OutboxSaveService(session))
+    await service.customer_credit_limit_exceeded(order_info)
+
+
+batch_mode = settings.CONSUMER_BATCH_SIZE > 1
+
+batch_consumers = {
+    customer_not_found_queue.name: BatchConsumer(CustomerNotFoundConsumerSchema, apply_customer_not_found),
+    customer_credit_reservation_queue.name: BatchConsumer(CustomerCreditReservationConsumerSchema,
+                                                          apply_credit_reservation),
+    customer_credit_limit_exceeded_queue.name: BatchConsumer(CustomerCreditLimitExceededConsumerSchema,
+                                                             apply_credit_limit_exceeded),
+}
+
+
+if not batch_mode:
+    @broker.subscriber(customer_not_found_queue)
+    async def customer_not_found(order_info: CustomerNotFoundConsumerSchema):
+        async with async_context_get_session() as session:
+            await apply_customer_not_found(session, order_info)
+
+    @broker.subscriber(customer_credit_reservation_queue)
+    async def credit_reservation(order_info: CustomerCreditReservationConsumerSchema):
+        async with async_context_get_session() as session:
+            await apply_credit_reservation(session, order_info)
+
+    @broker.subscriber(customer_credit_limit_exceeded_queue)
+    async def credit_limit_exceeded(order_info: CustomerCreditLimitExceededConsumerSchema):
+        async with async_context_get_session() as session:
+            await apply_credit_limit_exceeded(session, order_info)
 
 
 @app.after_startup
@@ -54,6 +79,23 @@ async def declare_and_bind():
     await robust_customer_credit_limit_exceeded_queue.bind(robust_customer_exchange,
                                                            "customer.customer_credit_limit_exceeded")
 
+    if batch_mode:
+        for robust_queue in (robust_customer_not_found_queue, robust_customer_credit_reservation_queue,
+                             robust_customer_credit_limit_exceeded_queue):
+            await batch_consumers[robust_queue.name].start(robust_queue)
+
+
+@app.on_shutdown
+async def stop_batch_consumers():
+    # before the broker is closed, the last batches still have to be acked
+    for consumer in batch_consumers.values():
+        await consumer.stop()
+
+
+@app.after_shutdown
+async def close_database():
+    await dispose_engine()
+
 
 if __name__ == "__main__":
     asyncio.run(app.run())
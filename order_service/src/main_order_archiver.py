@@ -0,0 +1,69 @@
+import asyncio
+import datetime
+import logging
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from src.config import settings
+from src.database import async_context_get_session, dispose_engine, get_engine
+from src.models import Order
+from src.partitions import create_monthly_partitions, drop_monthly_partitions
+from src.services import OrderArchiveService
+
+logger = logging.getLogger(__name__)
+
+
+async def maintain_order_partitions():
+    table = Order.__tablename__
+    async with get_engine().begin() as connection:
+        await create_monthly_partitions(connection, table, settings.ORDER_PARTITION_MONTHS_AHEAD)
+
+    # partitions older than the archiving windows are emptied by the archiver, only orders stuck in a
+    # non-terminal state keep them alive
+    archived_before = datetime.date.today() - datetime.timedelta(
+        days=max(settings.ORDER_ARCHIVE_AFTER_DAYS, settings.ORDER_ARCHIVE_APPROVED_AFTER_DAYS))
+    async with get_engine().begin() as connection:
+        dropped = await drop_monthly_partitions(connection, table, archived_before, keep_if="TRUE")
+    if dropped:
+        logger.info("Dropped empty order partitions: %s", dropped)
+
+
+async def archive_orders():
+    now = datetime.datetime.now()
+    terminal_before = now - datetime.timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+    approved_before = now - datetime.timedelta(days=settings.ORDER_ARCHIVE_APPROVED_AFTER_DAYS)
+
+    # one short transaction per batch, so row locks are held only for a single batch
+    archived = 0
+    while True:
+        async with async_context_get_session() as session:
+            moved = await OrderArchiveService(session).archive_batch(settings.ORDER_ARCHIVE_BATCH_SIZE,
+                                                                     terminal_before, approved_before)
+        archived += moved
+        if moved < settings.ORDER_ARCHIVE_BATCH_SIZE:
+            break
+
+    if archived:
+        logger.info(f"Archived {archived} orders")
+
+
+async def main():
+    scheduler = AsyncIOScheduler()
+
+    scheduler.add_job(maintain_order_partitions, trigger="interval", hours=settings.ORDER_PARTITION_INTERVAL_HOURS,
+                      next_run_time=datetime.datetime.now())
+    scheduler.add_job(archive_orders, trigger="interval", seconds=settings.ORDER_ARCHIVE_INTERVAL_SECONDS,
+                      max_instances=1, next_run_time=datetime.datetime.now())
+
+    scheduler.start()
+
+    try:
+        while True:
+            await asyncio.sleep(1000)
+    finally:
+        scheduler.shutdown()
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
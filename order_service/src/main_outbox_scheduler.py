@@ -1,35 +1,50 @@
 import asyncio
+import datetime
+import logging
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy.ext.asyncio import AsyncEngine
 
-from src.broker import get_broker, declare_exchanges
-from src.database import async_context_get_session
-from src.services import OutboxPublishService
+from src.config import settings
+from src.database import dispose_engine
+from src.models import OutboxMessageModel
+from src.partitions import create_monthly_partitions, drop_monthly_partitions
+from src.relay import OutboxRelay
 
-async def publish_outbox_messages():
-    async with async_context_get_session() as session:
+logger = logging.getLogger(__name__)
 
-        broker = get_broker()
-        await broker.connect()
-        await declare_exchanges(broker)
 
-        service = OutboxPublishService(session, broker)
-        await service.publish_all()
+async def maintain_outbox_partitions(engine: AsyncEngine):
+    table = OutboxMessageModel.__tablename__
+    async with engine.begin() as connection:
+        await create_monthly_partitions(connection, table, settings.OUTBOX_PARTITION_MONTHS_AHEAD)
 
-        await broker.close()
-        await session.commit()
+    retention_cutoff = datetime.date.today() - datetime.timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+    async with engine.begin() as connection:
+        dropped = await drop_monthly_partitions(connection, table, retention_cutoff, keep_if="processed_on IS NULL")
+    if dropped:
+        logger.info("Dropped outbox partitions: %s", dropped)
 
 
 async def main():
+    relay = OutboxRelay()
+    await relay.start()
+
     scheduler = AsyncIOScheduler()
 
-    scheduler.add_job(publish_outbox_messages, trigger="interval", seconds=5)
+    scheduler.add_job(relay.wakeup, trigger="interval", seconds=settings.OUTBOX_FALLBACK_POLL_SECONDS)
+    scheduler.add_job(maintain_outbox_partitions, args=[relay.engine], trigger="interval",
+                      hours=settings.OUTBOX_MAINTENANCE_INTERVAL_HOURS, next_run_time=datetime.datetime.now())
 
     scheduler.start()
 
-    while True:
-        await asyncio.sleep(1000)
+    try:
+        await relay.run()
+    finally:
+        scheduler.shutdown()
+        await relay.stop()
+        await dispose_engine()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -1,28 +1,55 @@
-import copy
 import datetime
+import json
 import logging
+from dataclasses import dataclass
 from decimal import Decimal
+from typing import Any
 
-from sqlalchemy import func, Integer, ForeignKey, JSON, orm
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from pydantic import BaseModel
+from sqlalchemy import func, Integer, ForeignKey, orm, Index, text, DDL, LargeBinary, event
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, Session, ORMExecuteState, \
+    with_loader_criteria
 
-from src.constants import OrderState, RejectionReason
+from src.constants import OrderState, RejectionReason, JSON_CONTENT_TYPE
 from src.events import Event, OrderCreatedEvent, OrderCanceledEvent
 
 logger = logging.getLogger(__name__)
 
 class Base(DeclarativeBase):
-    pass
+    @classmethod
+    def columns_for(cls, schema: type[BaseModel]) -> list:
+        """Columns ``schema`` is built from, selecting them returns plain rows instead of loaded instances."""
+        return [getattr(cls, name) for name in schema.model_fields]
 
 class BaseClass:
     id: Mapped[int] = mapped_column(primary_key=True)
     created_at: Mapped[datetime.datetime] = mapped_column(default=func.now())
-    deleted_at: Mapped[datetime.datetime | None]
+    deleted_at: Mapped[datetime.datetime | None] = mapped_column(default=None)
     updated_at: Mapped[datetime.datetime | None] = mapped_column(
         default=func.now(),
         onupdate=func.current_timestamp(),
     )
 
+@event.listens_for(Session, "do_orm_execute")
+def _filter_soft_deleted(execute_state: ORMExecuteState):
+    """Hides soft-deleted rows from every ORM SELECT, the ``include_deleted`` execution option turns it off.
+
+    Registered with the models so it applies to every session using them. Refreshes and lazy relationship
+    loads are not filtered, eager loaders like ``selectinload`` copy the options of the statement and are.
+    Core statements run on a plain connection and DML are not filtered either, those keep an explicit
+    ``deleted_at`` condition.
+    """
+    if (
+        execute_state.is_select
+        and not execute_state.is_column_load
+        and not execute_state.is_relationship_load
+        and not execute_state.execution_options.get("include_deleted", False)
+    ):
+        execute_state.statement = execute_state.statement.options(
+            with_loader_criteria(BaseClass, lambda cls: cls.deleted_at.is_(None), include_aliases=True,
+                                 propagate_to_loaders=False)
+        )
+
 class Versioned:
     version_id = mapped_column(Integer, nullable=False)
 
@@ -49,31 +76,70 @@ class Eventable:
         self._domain_events.append(event)
 
 
+@dataclass(frozen=True)
+class StateTransition:
+    """State change allowed only from ``from_state``, ``values`` are the columns it sets."""
+    from_state: OrderState
+    values: dict[str, Any]
+
+
 class Order(Eventable, Base, BaseClass, Versioned ):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_live_id", "id", postgresql_where=text("deleted_at IS NULL")),
+        # keyset pagination of live orders filtered by customer or state
+        Index("ix_orders_live_customer_id_id", "customer_id", "id", postgresql_where=text("deleted_at IS NULL")),
+        Index("ix_orders_live_state_id", "state", "id", postgresql_where=text("deleted_at IS NULL")),
+        # orders the archiver may move, by the time of their last change
+        Index("ix_orders_archivable_last_change", text("coalesce(updated_at, created_at)"),
+              postgresql_where=text("state IN ('APPROVED', 'REJECTED', 'CANCELLED')")),
+        {
+            "postgresql_partition_by": "RANGE (created_at)",
+            # rows outside of the monthly partitions land here instead of failing the insert
+            "listeners": [("after_create", DDL("CREATE TABLE IF NOT EXISTS orders_default "
+                                               "PARTITION OF orders DEFAULT").execute_if(dialect="postgresql"))],
+        },
+    )
 
+    # partitioned by created_at, so it has to be a part of the primary key
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(primary_key=True, default=func.now())
     state: Mapped[OrderState] = mapped_column(default=OrderState.PENDING)
     rejection_reason: Mapped[RejectionReason | None] = mapped_column(default=None)
     customer_id: Mapped[int]
     order_total: Mapped[int]
 
+    CUSTOMER_NOT_FOUND = StateTransition(
+        OrderState.PENDING, {"state": OrderState.REJECTED, "rejection_reason": RejectionReason.UNKNOWN_CUSTOMER},
+    )
+    CREDIT_RESERVATION = StateTransition(OrderState.PENDING, {"state": OrderState.APPROVED})
+    CREDIT_LIMIT_EXCEEDED = StateTransition(
+        OrderState.PENDING, {"state": OrderState.REJECTED, "rejection_reason": RejectionReason.INSUFFICIENT_CREDIT},
+    )
+
 
     @staticmethod
     def create(customer_id: int, order_total: int) -> "Order":
-        order = Order(customer_id=customer_id ,order_total=order_total)
+        order = Order(customer_id=customer_id ,order_total=order_total, state=OrderState.PENDING)
         order._add_domain_event(OrderCreatedEvent(customer_id, order_total))
         return order
 
     def customer_not_found(self):
-        self.rejection_reason = RejectionReason.UNKNOWN_CUSTOMER
-        self.state = OrderState.REJECTED
+        self._transition(Order.CUSTOMER_NOT_FOUND)
 
     def credit_reservation(self):
-        self.state = OrderState.APPROVED
+        self._transition(Order.CREDIT_RESERVATION)
 
     def credit_limit_exceeded(self):
-        self.state = OrderState.REJECTED
-        self.rejection_reason = RejectionReason.INSUFFICIENT_CREDIT
+        self._transition(Order.CREDIT_LIMIT_EXCEEDED)
+
+    def _transition(self, transition: StateTransition):
+        if self.state != transition.from_state:
+            logger.error(f"Order with id {self.id} in state {self.state} cannot move to {transition.values['state']}")
+            return
+
+        for name, value in transition.values.items():
+            setattr(self, name, value)
 
     def cancel(self):
         if self.state != OrderState.APPROVED:
@@ -84,24 +150,59 @@ class Order(Eventable, Base, BaseClass, Versioned ):
 
 
 
+class OrderArchive(Base, BaseClass):
+    """Terminal orders moved out of ``orders`` by the archiver, keeps their original ids."""
+    __tablename__ = "orders_archive"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    version_id: Mapped[int]
+    state: Mapped[OrderState]
+    rejection_reason: Mapped[RejectionReason | None]
+    customer_id: Mapped[int]
+    order_total: Mapped[int]
+    archived_at: Mapped[datetime.datetime] = mapped_column(default=func.now())
+
+
 class OutboxMessageModel(Base, BaseClass):
     __tablename__ = "outbox_messages"
+    __table_args__ = (
+        Index("ix_outbox_messages_unprocessed", "id", postgresql_where=text("processed_on IS NULL")),
+        # earlier unprocessed messages of an aggregate, checked when claiming
+        Index("ix_outbox_messages_unprocessed_aggregate_id", "aggregate_id", "id",
+              postgresql_where=text("processed_on IS NULL")),
+        {
+            "postgresql_partition_by": "RANGE (created_at)",
+            # rows outside of the monthly partitions land here instead of failing the insert
+            "listeners": [("after_create", DDL("CREATE TABLE IF NOT EXISTS outbox_messages_default "
+                                               "PARTITION OF outbox_messages DEFAULT").execute_if(dialect="postgresql"))],
+        },
+    )
 
+    # partitioned by created_at, so it has to be a part of the primary key
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(primary_key=True, default=func.now())
     exchange: Mapped[str]
     key: Mapped[str]
     aggregate_id: Mapped[int]
-    data: Mapped[dict] = mapped_column(type_=JSON)
+    # final message body, published to the broker as is
+    payload: Mapped[bytes] = mapped_column(type_=LargeBinary)
+    content_type: Mapped[str] = mapped_column(default=JSON_CONTENT_TYPE)
     processed_on: Mapped[datetime.datetime | None] = mapped_column(default=None)
 
 
-    def get_data_with_aggregate_id(self) -> dict:
-        data_copy = copy.deepcopy(self.data)
-        data_copy["aggregate_id"] = self.aggregate_id
-        return data_copy
+    @staticmethod
+    def serialize(aggregate_id, event: "Event") -> bytes:
+        return json.dumps({**event.data, "aggregate_id": aggregate_id}, separators=(",", ":")).encode()
+
+    @staticmethod
+    def values(aggregate_id, event: "Event") -> dict:
+        return {"aggregate_id": aggregate_id, "exchange": event.exchange, "key": event.key,
+                "payload": OutboxMessageModel.serialize(aggregate_id, event), "content_type": JSON_CONTENT_TYPE}
 
     @staticmethod
     def create(aggregate_id, event: "Event") -> "OutboxMessageModel":
-        return OutboxMessageModel(aggregate_id=aggregate_id, exchange=event.exchange, key=event.key, data=event.data)
+        return OutboxMessageModel(**OutboxMessageModel.values(aggregate_id, event))
 
     def __repr__(self):
-        return f"src.models.OutboxMessageModel ({self.data=} {self.exchange=} {self.key=})"
+        return f"src.models.OutboxMessageModel ({self.payload=} {self.exchange=} {self.key=})"
+
@@ -0,0 +1,214 @@
+import asyncio
+import dataclasses
+import logging
+import time
+
+import asyncpg
+from aio_pika.exceptions import CONNECTION_EXCEPTIONS
+from faststream.rabbit import RabbitBroker
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from src.broker import BrokerConnection
+from src.config import settings
+from src.constants import OUTBOX_NOTIFY_CHANNEL
+from src.database import get_engine
+from src.services import OutboxPublishService
+
+logger = logging.getLogger(__name__)
+
+DATABASE_EXCEPTIONS = (OSError, SQLAlchemyError, asyncpg.PostgresError, asyncpg.InterfaceError)
+
+
+class BrokerConnectionLost(Exception):
+    """Raised by a relay worker when publishing failed on the broker connection rather than the database."""
+
+
+@dataclasses.dataclass
+class RelayTickTimings:
+    """Durations of one relay tick in seconds, fetch/publish/commit are summed over all workers."""
+
+    connect: float = 0.0
+    fetch: float = 0.0
+    publish: float = 0.0
+    commit: float = 0.0
+    total: float = 0.0
+    fetched: int = 0
+    published: int = 0
+
+
+class OutboxRelay:
+    """Publishes outbox messages using one engine and one broker connection for the process lifetime.
+
+    Each tick runs ``OUTBOX_WORKERS`` concurrent workers which claim batches with ``FOR UPDATE SKIP LOCKED``,
+    so several relay processes can also run against the same database without publishing a message twice.
+
+    Ticks are triggered by ``NOTIFY`` from ``OutboxSaveService`` and by ``wakeup`` calls from a slow
+    fallback poll, which also covers notifications missed while the listener connection was down.
+    """
+
+    def __init__(self, engine: AsyncEngine | None = None, broker_connection: BrokerConnection | None = None):
+        self.engine = engine or get_engine()
+        self.session_maker = async_sessionmaker(bind=self.engine, expire_on_commit=False)
+        self.broker_connection = broker_connection or BrokerConnection()
+        self.last_tick: RelayTickTimings | None = None
+        self._wakeup = asyncio.Event()
+        self._listener: asyncpg.Connection | None = None
+
+    async def start(self):
+        await self.broker_connection.ensure_connected()
+        await self._ensure_listening()
+
+    async def stop(self):
+        await self._close_listener()
+        await self.broker_connection.close()
+
+    async def wakeup(self):
+        self._wakeup.set()
+
+    async def run(self):
+        self._wakeup.set()
+        backoff = settings.OUTBOX_ERROR_BACKOFF_SECONDS
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                await self._ensure_listening()
+                await self.tick()
+            except DATABASE_EXCEPTIONS:
+                # e.g. a Postgres restart or failover, the listener is reopened on the next tick
+                logger.exception(f"Database error in outbox relay, retrying in {backoff}s")
+                await self._close_listener()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, settings.OUTBOX_ERROR_BACKOFF_MAX_SECONDS)
+                self._wakeup.set()
+            else:
+                backoff = settings.OUTBOX_ERROR_BACKOFF_SECONDS
+
+    async def tick(self) -> RelayTickTimings:
+        timings = RelayTickTimings()
+        started = time.perf_counter()
+
+        broker = await self.broker_connection.ensure_connected()
+        timings.connect = time.perf_counter() - started
+        if broker is None:
+            timings.total = timings.connect
+            self.last_tick = timings
+            return timings
+
+        # every worker finishes before an error is handled, so none of them is left running into the next tick
+        results = await asyncio.gather(*(self._drain(broker, timings) for _ in range(settings.OUTBOX_WORKERS)),
+                                       return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        broker_errors = [error for error in errors if isinstance(error, BrokerConnectionLost)]
+        if broker_errors:
+            logger.error("Broker connection lost while publishing outbox messages", exc_info=broker_errors[0].__cause__)
+            await self.broker_connection.reset()
+        for error in errors:
+            if not isinstance(error, BrokerConnectionLost):
+                raise error
+
+        timings.total = time.perf_counter() - started
+        self.last_tick = timings
+        logger.info("Outbox relay tick: %s", timings)
+        return timings
+
+    async def _drain(self, broker: RabbitBroker, timings: RelayTickTimings):
+        """Claims and publishes batches until a claim comes back empty or a batch publishes nothing."""
+        while True:
+            async with self.session_maker() as session:
+                async with session.begin():
+                    service = OutboxPublishService(session, broker)
+
+                    mark = time.perf_counter()
+                    items = await service.claim(settings.OUTBOX_BATCH_SIZE)
+                    timings.fetch += time.perf_counter() - mark
+                    timings.fetched += len(items)
+                    if not items:
+                        return
+
+                    mark = time.perf_counter()
+                    try:
+                        published_ids = await service.publish(items)
+                    except CONNECTION_EXCEPTIONS as e:
+                        # OSError based like a lost database connection, told apart here by where it was raised
+                        raise BrokerConnectionLost() from e
+                    timings.publish += time.perf_counter() - mark
+
+                    mark = time.perf_counter()
+                    await service.mark_processed(published_ids)
+                timings.commit += time.perf_counter() - mark
+            timings.published += len(published_ids)
+
+            # rows skipped because another worker held their aggregate are picked up by the next claim
+            if not published_ids:
+                return
+
+    def _on_notify(self, connection: asyncpg.Connection, pid: int, channel: str, payload: str):
+        self._wakeup.set()
+
+    async def _ensure_listening(self):
+        if self._listener is not None and not self._listener.is_closed():
+            return
+
+        await self._close_listener()
+        # a dedicated connection, LISTEN would otherwise hold one slot of the pool shared with the workers
+        dsn = self.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        try:
+            self._listener = await asyncpg.connect(dsn)
+            await self._listener.add_listener(OUTBOX_NOTIFY_CHANNEL, self._on_notify)
+        except DATABASE_EXCEPTIONS:
+            logger.exception("Could not listen for outbox notifications, relying on fallback poll")
+            await self._close_listener()
+
+    async def _close_listener(self):
+        listener, self._listener = self._listener, None
+        if listener is None or listener.is_closed():
+            return
+        try:
+            await listener.remove_listener(OUTBOX_NOTIFY_CHANNEL, self._on_notify)
+            await listener.close(timeout=settings.OUTBOX_LISTENER_CLOSE_TIMEOUT_SECONDS)
+        except DATABASE_EXCEPTIONS:
+            logger.exception("Error closing outbox listener connection")
+            listener.terminate()
+
+
+class OutboxDirectPublisher:
+    """Publishes outbox messages right after the transaction that saved them has committed.
+
+    Messages it could not claim or publish stay unprocessed and are delivered by the relay.
+    """
+
+    def __init__(self, engine: AsyncEngine | None = None, broker_connection: BrokerConnection | None = None):
+        self._engine = engine
+        self.session_maker = async_sessionmaker(expire_on_commit=False)
+        self.broker_connection = broker_connection or BrokerConnection()
+
+    @property
+    def engine(self) -> AsyncEngine:
+        # resolved on every use, the shared engine is created anew after dispose_engine
+        return self._engine or get_engine()
+
+    async def start(self):
+        await self.broker_connection.ensure_connected()
+
+    async def stop(self):
+        await self.broker_connection.close()
+
+    async def publish(self, ids: list[int]) -> list[int]:
+        broker = await self.broker_connection.ensure_connected()
+        if broker is None:
+            return []
+
+        try:
+            async with self.session_maker(bind=self.engine) as session:
+                async with session.begin():
+                    service = OutboxPublishService(session, broker)
+                    items = await service.claim(len(ids), ids=ids)
+                    published_ids = await service.publish(items)
+                    await service.mark_processed(published_ids)
+        except CONNECTION_EXCEPTIONS:
+            logger.exception("Broker connection lost while publishing outbox messages directly")
+            await self.broker_connection.reset()
+            return []
+        return published_ids
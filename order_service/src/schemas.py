@@ -1,3 +1,5 @@
+import datetime
+
 
 from pydantic import BaseModel
 
@@ -9,10 +11,23 @@ class OrderSchema(BaseModel):
     state: OrderState
     rejection_reason: RejectionReason | None
 
+class OrderExportSchema(OrderSchema):
+    customer_id: int
+    order_total: int
+    created_at: datetime.datetime
+
+class OrderPageSchema(BaseModel):
+    items: list[OrderSchema]
+    # pass as after_id to get the next page, None on the last page
+    next_cursor: int | None
+
 class OrderCreateSchema(BaseModel):
     customer_id: int
     order_total: int
 
+class OrderBatchCreatedSchema(BaseModel):
+    ids: list[int]
+
 class OrderHandledConsumerSchema(BaseModel):
     aggregate_id: int
     order_id: int
@@ -25,3 +40,9 @@ class CustomerCreditReservationConsumerSchema(OrderHandledConsumerSchema):
 
 class CustomerCreditLimitExceededConsumerSchema(OrderHandledConsumerSchema):
     pass
+
+class PoolStatusSchema(BaseModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
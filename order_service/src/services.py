@@ -1,15 +1,20 @@
+import asyncio
 import datetime
 import logging
 from typing import Sequence
 
+from aio_pika.exceptions import DeliveryError
 from fastapi import HTTPException
 from faststream.exceptions import FastStreamException
 from faststream.rabbit import RabbitBroker
-from sqlalchemy import select
+from sqlalchemy import select, update, insert, delete, func, exists, inspect, or_, and_, Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
+from src.config import settings
+from src.constants import OUTBOX_NOTIFY_CHANNEL, OrderState
 from src.events import Event
-from src.models import OutboxMessageModel, Order
+from src.models import OutboxMessageModel, Order, OrderArchive, StateTransition
 from src.schemas import OrderCreateSchema, OrderSchema, CustomerNotFoundConsumerSchema, \
     CustomerCreditReservationConsumerSchema, CustomerCreditLimitExceededConsumerSchema
 
@@ -31,84 +36,256 @@ class OrderService(BaseService):
 
         return order
 
+    async def create_orders(self, orders_in: list[OrderCreateSchema]) -> list[int]:
+        """Creates the orders and their outbox messages with multi-row INSERTs, returns ids in input order."""
+        if len(orders_in) > settings.ORDER_BATCH_MAX_SIZE:
+            raise HTTPException(status_code=422, detail=f"At most {settings.ORDER_BATCH_MAX_SIZE} orders per batch")
+        if not orders_in:
+            return []
+
+        orders = [Order.create(customer_id=order_in.customer_id, order_total=order_in.order_total)
+                  for order_in in orders_in]
+        result = await self.session.execute(
+            insert(Order).returning(Order.id, sort_by_parameter_order=True),
+            [{"customer_id": order.customer_id, "order_total": order.order_total, "state": order.state}
+             for order in orders],
+        )
+        order_ids = list(result.scalars().all())
+
+        await self.events_save_service.save_many(
+            [(order_id, event) for order_id, order in zip(order_ids, orders) for event in order.events]
+        )
+        return order_ids
+
     async def customer_not_found(self, customer_not_found_info: CustomerNotFoundConsumerSchema):
-        stmt = select(Order).where(Order.id == customer_not_found_info.order_id and Order.deleted_at.is_(None))
-        result = await self.session.execute(stmt)
-        order = result.scalar_one_or_none()
-        if not order:
-            logger.error(f"Order with id {customer_not_found_info.order_id} for customer {customer_not_found_info.aggregate_id} not found")
-            return
-        order.customer_not_found()
-        await self.session.flush()
+        await self._transition(customer_not_found_info.order_id, Order.CUSTOMER_NOT_FOUND,
+                               customer_not_found_info.aggregate_id)
 
     async def customer_credit_reservation(self, credit_reservation_info: CustomerCreditReservationConsumerSchema):
-        stmt = select(Order).where(Order.id == credit_reservation_info.order_id and Order.deleted_at.is_(None))
-        result = await self.session.execute(stmt)
-        order = result.scalar_one_or_none()
-        if not order:
-            logger.error(f"Order with id {credit_reservation_info.order_id} for customer {credit_reservation_info.aggregate_id} not found")
-            return
-        order.credit_reservation()
-        await self.session.flush()
+        await self._transition(credit_reservation_info.order_id, Order.CREDIT_RESERVATION,
+                               credit_reservation_info.aggregate_id)
 
     async def customer_credit_limit_exceeded(self, credit_limit_exceeded_info: CustomerCreditLimitExceededConsumerSchema):
-        stmt = select(Order).where(Order.id == credit_limit_exceeded_info.order_id and Order.deleted_at.is_(None))
+        await self._transition(credit_limit_exceeded_info.order_id, Order.CREDIT_LIMIT_EXCEEDED,
+                               credit_limit_exceeded_info.aggregate_id)
+
+    async def _transition(self, order_id: int, transition: StateTransition, customer_id: int):
+        """Applies the transition with one guarded UPDATE instead of loading the order first."""
+        # the soft-delete filter of the session covers ORM SELECTs only, not UPDATEs
+        stmt = (
+            update(Order)
+            .where(Order.id == order_id, Order.state == transition.from_state, Order.deleted_at.is_(None))
+            .values(**transition.values, version_id=Order.version_id + 1)
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        )
         result = await self.session.execute(stmt)
-        order = result.scalar_one_or_none()
-        if not order:
-            logger.error(f"Order with id {credit_limit_exceeded_info.order_id} for customer {credit_limit_exceeded_info.aggregate_id} not found")
-            return
-        order.credit_limit_exceeded()
-        await self.session.flush()
+        if result.scalar_one_or_none() is None:
+            logger.error(f"Order with id {order_id} for customer {customer_id} not found "
+                         f"or not in state {transition.from_state.value}")
 
     async def cancel_order(self, order_id: int):
-        stmt = select(Order).where(Order.id == order_id and Order.deleted_at.is_(None))
+        stmt = select(Order).where(Order.id == order_id)
         result = await self.session.execute(stmt)
         order = result.scalar_one_or_none()
         if not order:
-            logger.error(f"Order with id {order_id} not found")
-            return
+            if await self.session.scalar(select(exists().where(OrderArchive.id == order_id))):
+                raise HTTPException(status_code=409, detail="Order is archived and can no longer be cancelled")
+            raise HTTPException(status_code=404, detail="Order not found")
         order.cancel()
         await self.events_save_service.save(order.id, order.events)
         await self.session.flush()
 
-    async def get_order_by_id(self, item_id) -> Order:
-        result = await self.session.execute(select(Order).where(Order.id == item_id, Order.deleted_at.is_(None)))
-        order = result.scalar_one_or_none()
+    async def get_order_by_id(self, item_id) -> Row:
+        """Returns the ``OrderSchema`` columns of the order, read as a row without loading an ``Order``."""
+        result = await self.session.execute(select(*Order.columns_for(OrderSchema))
+                                            .where(Order.id == item_id))
+        order = result.one_or_none()
+        if not order:
+            result = await self.session.execute(select(*OrderArchive.columns_for(OrderSchema))
+                                                .where(OrderArchive.id == item_id))
+            order = result.one_or_none()
         if not order:
             raise HTTPException(status_code=404, detail="Order not found")
         return order
 
-    async def get_list(self) -> Sequence[Order]:
-        stmt = select(Order).where(Order.deleted_at.is_(None))
+    async def get_list(self, limit: int, after_id: int | None = None, customer_id: int | None = None,
+                       state: OrderState | None = None) -> Sequence[Row]:
+        """Returns ``OrderSchema`` columns of up to ``limit`` orders with ids greater than ``after_id``, ordered by id."""
+        stmt = select(*Order.columns_for(OrderSchema))
+        if after_id is not None:
+            stmt = stmt.where(Order.id > after_id)
+        if customer_id is not None:
+            stmt = stmt.where(Order.customer_id == customer_id)
+        if state is not None:
+            stmt = stmt.where(Order.state == state)
+        result = await self.session.execute(stmt.order_by(Order.id).limit(limit))
+        return result.all()
+
+
+class OrderArchiveService:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def archive_batch(self, limit: int, terminal_before: datetime.datetime,
+                            approved_before: datetime.datetime) -> int:
+        """Moves up to ``limit`` terminal orders into ``orders_archive`` with one statement, returns how many moved.
+
+        Rejected and cancelled orders move once untouched since ``terminal_before``, approved ones since
+        ``approved_before`` as they can still be cancelled. Rows locked by a running transaction are skipped.
+        """
+        orders = Order.__table__
+        orders_archive = OrderArchive.__table__
+        last_change = func.coalesce(orders.c.updated_at, orders.c.created_at)
+        # matches ix_orders_archivable_last_change, no ORDER BY so the scan stops after ``limit`` rows
+        candidates = (
+            select(orders.c.id)
+            .where(or_(
+                and_(orders.c.state.in_([OrderState.REJECTED, OrderState.CANCELLED]), last_change < terminal_before),
+                and_(orders.c.state == OrderState.APPROVED, last_change < approved_before),
+            ))
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        moved_orders = (
+            delete(orders)
+            .where(orders.c.id.in_(candidates.scalar_subquery()))
+            .returning(*orders.c)
+            .cte("moved_orders")
+        )
+        columns = [column.name for column in orders.c]
+        stmt = insert(orders_archive).from_select(columns, select(*(moved_orders.c[name] for name in columns)))
         result = await self.session.execute(stmt)
-        return result.scalars().all()
+        return result.rowcount
 
 
 class OutboxSaveService:
     def __init__(self, session: AsyncSession):
         self.session = session
+        self.saved: list[OutboxMessageModel] = []
+        self.saved_many_ids: list[int] = []
 
     async def save(self, aggregate_id: int, events: list[Event]):
         outbox_models = [OutboxMessageModel.create(aggregate_id, event) for event in events]
         self.session.add_all(outbox_models)
+        self.saved.extend(outbox_models)
+        if outbox_models:
+            await self.notify()
+
+    async def save_many(self, events: list[tuple[int, Event]]):
+        """Saves ``(aggregate_id, event)`` pairs with one multi-row INSERT instead of an ORM object per message."""
+        if not events:
+            return
+        result = await self.session.execute(
+            insert(OutboxMessageModel).returning(OutboxMessageModel.id),
+            [OutboxMessageModel.values(aggregate_id, event) for aggregate_id, event in events],
+        )
+        self.saved_many_ids.extend(result.scalars().all())
+        await self.notify()
+
+    def saved_ids(self) -> list[int]:
+        """Ids of the saved messages which were flushed and not rolled back, read without a database round-trip."""
+        states = (inspect(message) for message in self.saved)
+        return [state.identity[0] for state in states if state.identity is not None] + self.saved_many_ids
+
+    async def notify(self):
+        """Wakes up the relay, Postgres delivers the notification only when the transaction commits."""
+        await self.session.execute(select(func.pg_notify(OUTBOX_NOTIFY_CHANNEL, "")))
 
 class OutboxPublishService:
     def __init__(self, session: AsyncSession, broker: RabbitBroker):
         self.session = session
         self.broker = broker
 
-    async def publish_all(self):
-        stmt = select(OutboxMessageModel).where(OutboxMessageModel.processed_on.is_(None))
+    async def claim(self, limit: int, ids: list[int] | None = None) -> Sequence[OutboxMessageModel]:
+        """Locks a batch of unprocessed messages, rows locked by other relay workers are skipped.
+
+        Every aggregate in the batch is also locked for the rest of the transaction, so messages of one
+        aggregate are never split between concurrent workers and keep their order. A message is claimed
+        only together with all earlier unprocessed messages of its aggregate, so it cannot overtake one
+        which is row-locked by another worker. When ``ids`` are given only those messages are claimed.
+        """
+        candidates = select(OutboxMessageModel).where(OutboxMessageModel.processed_on.is_(None))
+        if ids is not None:
+            candidates = candidates.where(OutboxMessageModel.id.in_(ids))
+        candidates = (
+            candidates
+            .order_by(OutboxMessageModel.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .cte("candidates")
+            .prefix_with("MATERIALIZED")
+        )
+        candidate = aliased(OutboxMessageModel, candidates)
+        earlier = aliased(OutboxMessageModel)
+        # materialized as well, so aggregates are locked only for messages which passed the check
+        ready = (
+            select(candidate)
+            .where(~exists().where(
+                earlier.aggregate_id == candidate.aggregate_id,
+                earlier.processed_on.is_(None),
+                earlier.id < candidate.id,
+                earlier.id.not_in(select(candidates.c.id)),
+            ))
+            .cte("ready")
+            .prefix_with("MATERIALIZED")
+        )
+        claimed = aliased(OutboxMessageModel, ready)
+        stmt = (
+            select(claimed)
+            .where(func.pg_try_advisory_xact_lock(func.hashtext(OutboxMessageModel.__tablename__), claimed.aggregate_id))
+            .order_by(claimed.id)
+        )
 
         result = await self.session.execute(stmt)
-        items = result.scalars().all()
+        return result.scalars().all()
+
+    async def publish(self, items: Sequence[OutboxMessageModel]) -> list[int]:
+        """Publishes messages keeping up to ``OUTBOX_PUBLISH_WINDOW`` of them awaiting a publisher confirm.
+
+        Messages are split into one lane per aggregate, lanes run concurrently and each lane publishes
+        in order. Returns ids of the confirmed messages, nacked or failed ones stay unprocessed and are
+        claimed again.
+        """
+        lanes: dict[int, list[OutboxMessageModel]] = {}
         for event in items:
+            lanes.setdefault(event.aggregate_id, []).append(event)
+
+        window = asyncio.Semaphore(settings.OUTBOX_PUBLISH_WINDOW)
+        # every lane has to stop before an error reaches the caller, which then unlocks the claimed rows
+        results = await asyncio.gather(*(self._publish_lane(lane, window) for lane in lanes.values()),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return [event_id for lane_ids in results for event_id in lane_ids]
+
+    async def _publish_lane(self, lane: list[OutboxMessageModel], window: asyncio.Semaphore) -> list[int]:
+        published_ids = []
+        for event in lane:
+            # later messages of the aggregate must not overtake the failed one
+            if not await self._publish_one(event, window):
+                break
+            published_ids.append(event.id)
+        return published_ids
+
+    async def _publish_one(self, event: OutboxMessageModel, window: asyncio.Semaphore) -> bool:
+        async with window:
             try:
-                await self.broker.publish(event.get_data_with_aggregate_id(), exchange=event.exchange, routing_key=event.key)
-                logger.info("Published event: %s", event)
-            except FastStreamException:
+                await self.broker.publish(event.payload, exchange=event.exchange, routing_key=event.key,
+                                          content_type=event.content_type, timeout=settings.OUTBOX_PUBLISH_TIMEOUT_SECONDS)
+            except (FastStreamException, DeliveryError, asyncio.TimeoutError):
                 logger.exception(f"Error publishing outbox message message_id {event.id}")
-                continue
-            event.processed_on = datetime.datetime.now()
-            self.session.add(event)
+                return False
+        logger.info("Published event: %s", event)
+        return True
+
+    async def mark_processed(self, ids: list[int]):
+        if not ids:
+            return
+        stmt = (
+            update(OutboxMessageModel)
+            .where(OutboxMessageModel.id.in_(ids))
+            .values(processed_on=datetime.datetime.now())
+        )
+        await self.session.execute(stmt, execution_options={"synchronize_session": False})
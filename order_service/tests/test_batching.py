@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import text
+
+from src import database
+from src.batching import BatchConsumer
+from src.schemas import CustomerCreditReservationConsumerSchema
+
+
+class RecordedMessage:
+    def __init__(self, message_id: str, body: bytes):
+        self.message_id = message_id
+        self.body = body
+        self.outcome = None
+
+    async def ack(self):
+        self.outcome = "ack"
+
+    async def nack(self, requeue: bool):
+        self.outcome = "requeue" if requeue else "drop"
+
+
+async def apply_message(session, item: CustomerCreditReservationConsumerSchema):
+    if item.order_id == 2:
+        await session.execute(text("DO $$ BEGIN RAISE EXCEPTION 'conflict' "
+                                    "USING ERRCODE = 'serialization_failure'; END $$"))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_batch_requeues_transient_failures_and_drops_the_rest(db_engine, monkeypatch, caplog):
+    monkeypatch.setattr(database, "_engine", db_engine)
+    consumer = BatchConsumer(CustomerCreditReservationConsumerSchema, apply_message)
+    consumer._queue = SimpleNamespace(name="order.customer_credit_reservation")
+    applied, transient, invalid = [RecordedMessage(str(order_id), body) for order_id, body in (
+        (1, b'{"aggregate_id": 1, "order_id": 1}'),
+        (2, b'{"aggregate_id": 1, "order_id": 2}'),
+        (3, b'{"aggregate_id": 1}'),
+    )]
+
+    await consumer._process([applied, transient, invalid])
+
+    assert [applied.outcome, transient.outcome, invalid.outcome] == ["ack", "requeue", "drop"]
+    assert '{"aggregate_id": 1}' in caplog.text
@@ -0,0 +1,76 @@
+import pytest
+import pytest_asyncio
+from pydantic import PostgresDsn
+from sqlalchemy import make_url, text, select, update, func
+
+from src import database
+from src.config import settings
+from src.models import Order
+from src.schemas import OrderCreateSchema
+
+
+@pytest_asyncio.fixture(loop_scope="session", scope="function")
+async def set_read_url(db_engine, monkeypatch):
+    def set_read_url(port: int | None = None):
+        url = make_url(settings.TEST_DATABASE_URL.unicode_string())
+        if port is not None:
+            url = url.set(port=port)
+        monkeypatch.setattr(settings, "DATABASE_READ_URL", PostgresDsn(url.render_as_string(hide_password=False)))
+
+    yield set_read_url
+    await database.dispose_engine()
+
+
+async def settle_replica_check():
+    if database._replica_check_task is not None:
+        await database._replica_check_task
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_reads_go_to_replica_once_checked(set_read_url):
+    set_read_url()
+
+    assert database.get_read_engine() is database.get_primary_read_engine()
+    await settle_replica_check()
+
+    assert database.get_read_engine() is database.get_replica_engine()
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_reads_fall_back_to_primary_when_replica_is_down(set_read_url, monkeypatch):
+    set_read_url(port=1)
+    # as if the replica went down right after the last lag check
+    monkeypatch.setattr(database, "_replica_fresh", True)
+    monkeypatch.setattr(database, "_replica_checked_at", float("inf"))
+
+    async with database.connect_read() as connection:
+        assert (await connection.execute(text("SELECT 1"))).scalar() == 1
+        assert connection.engine is database.get_primary_read_engine()
+
+    assert database.get_read_engine() is database.get_primary_read_engine()
+
+
+async def create_deleted_order(order_service, db_session) -> Order:
+    order = await order_service.create_order(OrderCreateSchema(customer_id=1, order_total=100))
+    await db_session.execute(update(Order).where(Order.id == order.id).values(deleted_at=func.now()))
+    return order
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_soft_deleted_rows_are_hidden_from_selects(order_service, db_session):
+    order = await create_deleted_order(order_service, db_session)
+
+    assert await db_session.scalar(select(Order).where(Order.id == order.id)) is None
+    assert await db_session.scalar(select(Order.customer_id).where(Order.id == order.id)) is None
+    assert await db_session.scalar(select(func.count()).select_from(Order).where(Order.id == order.id)) == 0
+    assert await db_session.scalar(select(Order.id).where(Order.id == order.id)
+                                   .execution_options(include_deleted=True)) == order.id
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_refresh_loads_soft_deleted_row(order_service, db_session):
+    order = await create_deleted_order(order_service, db_session)
+
+    await db_session.refresh(order)
+
+    assert order.deleted_at is not None
@@ -1,9 +1,11 @@
 
+import json
+
 import pytest
 
 from src.constants import OrderState, RejectionReason
 from src.events import OrderCreatedEvent
-from src.models import Order
+from src.models import Order, OutboxMessageModel
 
 
 def test_order_produce_created_event_on_create():
@@ -51,3 +53,22 @@ def test_order_credit_cancel():
     order.cancel()
 
     assert order.state == OrderState.CANCELLED
+
+
+def test_outbox_message_payload_includes_aggregate_id():
+    order = Order.create(customer_id=1, order_total=100)
+
+    message = OutboxMessageModel.create(5, order.events[0])
+
+    assert json.loads(message.payload) == {"customer_id": 1, "order_total": 100, "aggregate_id": 5}
+    assert message.content_type == "application/json"
+
+
+def test_order_transition_allowed_only_from_pending():
+    order = Order.create(customer_id=1, order_total=100)
+    order.credit_reservation()
+
+    order.credit_limit_exceeded()
+
+    assert order.state == OrderState.APPROVED
+    assert order.rejection_reason is None
@@ -0,0 +1,112 @@
+import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, update, func
+
+from src.constants import OrderState, RejectionReason
+from src.models import Order, OutboxMessageModel
+from src.schemas import OrderCreateSchema, CustomerCreditReservationConsumerSchema, \
+    CustomerCreditLimitExceededConsumerSchema
+from src.services import OrderArchiveService
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_credit_reservation_approves_pending_order(order_service, db_session):
+    order = await order_service.create_order(OrderCreateSchema(customer_id=1, order_total=100))
+
+    await order_service.customer_credit_reservation(
+        CustomerCreditReservationConsumerSchema(aggregate_id=1, order_id=order.id))
+
+    await db_session.refresh(order)
+    assert order.state == OrderState.APPROVED
+    assert order.version_id == 2
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_transition_ignored_when_order_is_not_pending(order_service, db_session):
+    order = await order_service.create_order(OrderCreateSchema(customer_id=1, order_total=100))
+    await order_service.customer_credit_reservation(
+        CustomerCreditReservationConsumerSchema(aggregate_id=1, order_id=order.id))
+
+    await order_service.customer_credit_limit_exceeded(
+        CustomerCreditLimitExceededConsumerSchema(aggregate_id=1, order_id=order.id))
+
+    await db_session.refresh(order)
+    assert order.state == OrderState.APPROVED
+    assert order.rejection_reason is None
+    assert order.version_id == 2
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_credit_limit_exceeded_rejects_pending_order(order_service, db_session):
+    order = await order_service.create_order(OrderCreateSchema(customer_id=1, order_total=100))
+
+    await order_service.customer_credit_limit_exceeded(
+        CustomerCreditLimitExceededConsumerSchema(aggregate_id=1, order_id=order.id))
+
+    await db_session.refresh(order)
+    assert order.state == OrderState.REJECTED
+    assert order.rejection_reason == RejectionReason.INSUFFICIENT_CREDIT
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_orders_returns_ids_in_input_order(order_service, db_session):
+    orders_in = [OrderCreateSchema(customer_id=customer_id, order_total=10 * customer_id) for customer_id in (3, 1, 2)]
+
+    order_ids = await order_service.create_orders(orders_in)
+
+    result = await db_session.execute(select(Order.id, Order.customer_id, Order.order_total, Order.state)
+                                      .where(Order.id.in_(order_ids)))
+    orders = {row.id: row for row in result.all()}
+    assert [orders[order_id].customer_id for order_id in order_ids] == [3, 1, 2]
+    assert [orders[order_id].order_total for order_id in order_ids] == [30, 10, 20]
+    assert all(order.state == OrderState.PENDING for order in orders.values())
+
+    result = await db_session.execute(select(OutboxMessageModel.aggregate_id)
+                                      .where(OutboxMessageModel.id.in_(order_service.events_save_service.saved_ids()))
+                                      .order_by(OutboxMessageModel.id))
+    assert result.scalars().all() == order_ids
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_archive_moves_only_terminal_orders(order_service, db_session):
+    rejected, approved, pending = [await order_service.create_order(OrderCreateSchema(customer_id=1, order_total=100))
+                                   for _ in range(3)]
+    await order_service.customer_credit_limit_exceeded(
+        CustomerCreditLimitExceededConsumerSchema(aggregate_id=1, order_id=rejected.id))
+    await order_service.customer_credit_reservation(
+        CustomerCreditReservationConsumerSchema(aggregate_id=1, order_id=approved.id))
+    order_ids = [rejected.id, approved.id, pending.id]
+    await db_session.execute(update(Order).where(Order.id.in_(order_ids))
+                             .values(updated_at=func.now() - datetime.timedelta(days=40)))
+
+    now = datetime.datetime.now()
+    moved = await OrderArchiveService(db_session).archive_batch(10, terminal_before=now - datetime.timedelta(days=30),
+                                                                approved_before=now - datetime.timedelta(days=180))
+
+    assert moved == 1
+    result = await db_session.execute(select(Order.id).where(Order.id.in_(order_ids)).order_by(Order.id))
+    assert result.scalars().all() == [approved.id, pending.id]
+    archived = await order_service.get_order_by_id(rejected.id)
+    assert (archived.id, archived.state, archived.rejection_reason) == (
+        rejected.id, OrderState.REJECTED, RejectionReason.INSUFFICIENT_CREDIT)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_cancel_archived_order_is_rejected(order_service, db_session):
+    order = await order_service.create_order(OrderCreateSchema(customer_id=1, order_total=100))
+    await order_service.customer_credit_reservation(
+        CustomerCreditReservationConsumerSchema(aggregate_id=1, order_id=order.id))
+    await db_session.execute(update(Order).where(Order.id == order.id)
+                             .values(updated_at=func.now() - datetime.timedelta(days=200)))
+    now = datetime.datetime.now()
+    await OrderArchiveService(db_session).archive_batch(10, terminal_before=now, approved_before=now)
+
+    with pytest.raises(HTTPException) as archived:
+        await order_service.cancel_order(order.id)
+    with pytest.raises(HTTPException) as unknown:
+        await order_service.cancel_order(-1)
+
+    assert archived.value.status_code == 409
+    assert unknown.value.status_code == 404
@@ -0,0 +1,95 @@
+import asyncio
+from typing import AsyncGenerator
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.events import OrderCreatedEvent
+from src.models import OutboxMessageModel
+from src.services import OutboxPublishService
+
+
+@pytest_asyncio.fixture(loop_scope="session", scope="function")
+async def session_maker(db_engine) -> AsyncGenerator[async_sessionmaker[AsyncSession], None]:
+    """Sessions committing for real, claims run concurrently in separate transactions."""
+    session_maker = async_sessionmaker(bind=db_engine, expire_on_commit=False)
+    yield session_maker
+    async with session_maker.begin() as session:
+        await session.execute(delete(OutboxMessageModel))
+
+
+async def save_messages(session_maker: async_sessionmaker[AsyncSession], aggregate_ids: list[int]) -> list[int]:
+    async with session_maker.begin() as session:
+        ids = []
+        for aggregate_id in aggregate_ids:
+            message = OutboxMessageModel.create(aggregate_id, OrderCreatedEvent(customer_id=1, order_total=100))
+            session.add(message)
+            await session.flush()
+            ids.append(message.id)
+    return ids
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_concurrent_claims_do_not_share_an_aggregate(session_maker):
+    first, second, other = await save_messages(session_maker, [1, 1, 2])
+
+    async with session_maker.begin() as session_a, session_maker.begin() as session_b:
+        claimed_a = await OutboxPublishService(session_a, None).claim(1)
+        claimed_b = await OutboxPublishService(session_b, None).claim(10)
+
+        assert [message.id for message in claimed_a] == [first]
+        assert [message.id for message in claimed_b] == [other]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_claim_does_not_overtake_message_locked_by_another_worker(session_maker):
+    first, second, other, third = await save_messages(session_maker, [1, 1, 2, 1])
+
+    async with session_maker() as session_a, session_maker() as session_b, session_maker() as session_c:
+        await session_a.begin()
+        claimed_a = await OutboxPublishService(session_a, None).claim(1)
+        assert [message.id for message in claimed_a] == [first]
+
+        # row-locks the second message but cannot publish it while the first one is unprocessed
+        await session_b.begin()
+        assert await OutboxPublishService(session_b, None).claim(1) == []
+
+        await OutboxPublishService(session_a, None).mark_processed([first])
+        await session_a.commit()
+
+        await session_c.begin()
+        claimed_c = await OutboxPublishService(session_c, None).claim(10)
+        assert [message.id for message in claimed_c] == [other]
+
+        await session_b.rollback()
+        await session_c.rollback()
+
+
+class LosingConnectionBroker:
+    """Loses the connection on the first message of aggregate 1, aggregate 2 publishes slowly."""
+
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, payload, **kwargs):
+        if kwargs["routing_key"] == "lost":
+            raise ConnectionError()
+        await asyncio.sleep(0.01)
+        self.published.append(payload)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_publish_raises_only_after_every_lane_stopped():
+    broker = LosingConnectionBroker()
+    lost = OutboxMessageModel.create(1, OrderCreatedEvent(customer_id=1, order_total=100))
+    lost.key = "lost"
+    others = [OutboxMessageModel.create(2, OrderCreatedEvent(customer_id=1, order_total=index)) for index in range(3)]
+    for index, message in enumerate([lost, *others]):
+        message.id = index
+
+    with pytest.raises(ConnectionError):
+        await OutboxPublishService(None, broker).publish([lost, *others])
+
+    assert len(broker.published) == 3
@@ -0,0 +1,27 @@
+import datetime
+
+import pytest
+from sqlalchemy import text, update
+
+from src.models import Order
+from src.partitions import add_months, month_start, partition_name, create_monthly_partitions
+from src.schemas import OrderCreateSchema
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_partition_moves_rows_out_of_default_partition(order_service, db_session):
+    next_month = add_months(month_start(datetime.date.today()), 1)
+    order = await order_service.create_order(OrderCreateSchema(customer_id=1, order_total=100))
+    await db_session.execute(update(Order).where(Order.id == order.id)
+                             .values(created_at=datetime.datetime.combine(next_month, datetime.time(12))))
+    connection = await db_session.connection()
+    await connection.execute(text(f"DROP TABLE IF EXISTS {partition_name('orders', next_month)}"))
+
+    await create_monthly_partitions(connection, "orders", 2)
+
+    result = await connection.execute(text(f"SELECT id FROM {partition_name('orders', next_month)}"))
+    assert order.id in result.scalars().all()
+    result = await connection.execute(text("SELECT count(*) FROM orders_default WHERE id = :id"), {"id": order.id})
+    assert result.scalar() == 0
+    result = await connection.execute(text("SELECT relispartition FROM pg_class WHERE relname = 'orders_default'"))
+    assert result.scalar() is True